@@ -5,13 +5,16 @@ import asyncio
 import typing
 import random
 from dotenv import load_dotenv
-import json
 import time
 
 from HelperBotConstants import *
 import HelperBotFunctions
+import HelperBotDispatcher
+import HelperBotArchiver
 import HelperBotReminderOrganizer
+import HelperBotReminderStorage
 import HelperBotAutoCleaner
+import HelperBotMessageDeleter
 from HelperBotCustomizations import *
 
 logging.basicConfig(level=logging.INFO)
@@ -24,8 +27,15 @@ bot = commands.Bot(command_prefix=COMMAND_PREFIX, description=description, inten
                    activity=discord.Game(name=f'{COMMAND_PREFIX}help'))
 load_dotenv()
 token = os.getenv('DISCORD_TOKEN')
-reminder_organizer = HelperBotReminderOrganizer.ReminderOrganizer(bot)
+reminder_organizer = HelperBotReminderOrganizer.ReminderOrganizer(bot, run_scheduler=not REMINDER_SHARDED)
 auto_cleaner = HelperBotAutoCleaner.AutoCleaner(bot)
+message_deleter = HelperBotMessageDeleter.MessageDeleter()
+
+
+@bot.event
+async def setup_hook():
+    # Load reminders while logging in
+    reminder_organizer.begin_loading()
 
 
 @bot.event
@@ -41,6 +51,35 @@ async def on_ready():
     if not (reminder_organizer.get_started() and auto_cleaner.get_started()):
         await asyncio.gather(t1, t2)
 
+@bot.event
+async def on_guild_channel_create(channel):
+    auto_cleaner.update_channel(channel)
+
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    auto_cleaner.update_channel(after)
+
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    auto_cleaner.remove_channel(channel.id)
+
+
+@bot.event
+async def on_guild_channel_pins_update(channel, last_pin):
+    auto_cleaner.note_pins_update(channel.id)
+
+
+@bot.event
+async def on_guild_join(guild):
+    auto_cleaner.add_guild(guild)
+
+
+@bot.event
+async def on_guild_remove(guild):
+    auto_cleaner.remove_guild(guild)
+
 @bot.event
 async def on_command_error(ctx, error):
     if hasattr(ctx.command, 'on_error'):
@@ -74,11 +113,12 @@ async def on_raw_reaction_remove(payload):
 
 @bot.listen()
 async def on_message(message):
+    auto_cleaner.note_message(message)
     # Don't react to own messages
     if message.author.id == bot.user.id:
         return
     message_content = message.content
-    new_message_content = HelperBotFunctions.clean_youtube_links(message_content)
+    new_message_content = HelperBotFunctions.clean_links(message_content)
     # If message was changed, send new one and remove old
     if new_message_content != message_content:
         # Remove message
@@ -110,7 +150,8 @@ async def remindme(ctx):
         await reminder_organizer.reminder_help(ctx, "Your message wasn't formatted correctly\n")
 
 
-@bot.command(aliases=["remove"], description="Deletes given amount of messages", brief="Deletes given amount of messages")
+@bot.group(name="delete", aliases=["remove"], invoke_without_command=True, case_insensitive=True,
+           description="Deletes given amount of messages", brief="Deletes given amount of messages")
 async def delete(ctx, how_many: int):
     message = ctx.message
     private = False
@@ -124,6 +165,10 @@ async def delete(ctx, how_many: int):
         await HelperBotFunctions.send_messages(
             [HelperBotFunctions.craft_too_many_warning_message(MAXIMUM_REMOVED_MESSAGES)], message.channel)
         return
+    if message_deleter.get_job(message.channel.id) is not None:
+        await HelperBotFunctions.send_messages([f"Messages are already being deleted on this channel. Use "
+                                                f"{COMMAND_PREFIX}delete cancel to stop."], message.channel)
+        return
     try:
         # Get confirmation
         await HelperBotFunctions.send_messages(["Confirm deletion of ", how_many, " messages (y/n)"], message.channel)
@@ -134,29 +179,36 @@ async def delete(ctx, how_many: int):
         await bot.wait_for('message', check=check, timeout=10.0)
         # Add 2 to account for confirmation message and 1 to account for initial message
         how_many += 3
-        # Purge limit is 120 so split into chunks
-        how_many_120s = int(how_many / 120)
-        how_many_ones = how_many - how_many_120s * 120
-        if not private:
-            for i in range(how_many_120s):
-                await message.channel.purge(limit=120)
-            await message.channel.purge(limit=how_many_ones)
-        else:
-            async for chat_message in message.channel.history(limit=how_many):
-                if chat_message.author.id == bot.user.id:
-                    await chat_message.delete()
+        # Only own messages can be deleted in private channels
+        only_from = bot.user.id if private else None
+        if message_deleter.start_job(message.channel, message.author, how_many, only_from) is None:
+            await HelperBotFunctions.send_messages([f"Messages are already being deleted on this channel. Use "
+                                                    f"{COMMAND_PREFIX}delete cancel to stop."], message.channel)
     except asyncio.TimeoutError:
         return await HelperBotFunctions.send_messages(['Sorry, you took too long.'], message.channel)
 
 
+@delete.command(name="cancel", aliases=["stop"], description="Stops deleting messages on this channel", brief="Stops deleting messages on this channel")
+async def delete_cancel(ctx):
+    channel = ctx.message.channel
+    job = message_deleter.get_job(channel.id)
+    if job is None:
+        return await HelperBotFunctions.send_messages(["Messages aren't being deleted on this channel."], channel)
+    # Others can stop a job only if they could delete the messages themselves
+    if job.get_author().id != ctx.author.id and \
+            (ctx.guild is None or not channel.permissions_for(ctx.author).manage_messages):
+        return await HelperBotFunctions.send_messages(["Only the one who started deleting can cancel it."], channel)
+    message_deleter.cancel_job(channel.id)
+
+
 @remindme.command(name="help", description="Help for reminders", brief="Help for reminders")
 async def reminder_help(ctx):
     await reminder_organizer.reminder_help(ctx)
 
 
-@remindme.command(name="remove", aliases=["delete"], description="Deletes reminder at given index", brief="Deletes reminder at given index")
-async def delete(ctx, index: int):
-    await reminder_organizer.delete(ctx, index)
+@remindme.command(name="remove", aliases=["delete"], description="Deletes reminder with given id", brief="Deletes reminder with given id")
+async def delete(ctx, reminder_id: int):
+    await reminder_organizer.delete(ctx, reminder_id)
 
 
 @remindme.command(name="list", description="Lists all reminders", brief="Lists all reminders")
@@ -187,18 +239,18 @@ async def time_measures(ctx):
 
 @remindme.command(name="add_interval", aliases=["interval", "every"], pass_context=True,
                   description="Adds an interval of every x [Time Measure] to a reminder", brief="Adds an interval of every x [Time Measure] to a reminder")
-async def add_interval(ctx, index: int, interval: int, time_measure: str):
-    this_reminder = await reminder_organizer.get_reminder_with_index(ctx.message, index)
+async def add_interval(ctx, reminder_id: int, interval: int, time_measure: str):
+    this_reminder = await reminder_organizer.get_reminder_with_id(ctx.message, reminder_id)
     await reminder_organizer.add_interval(ctx.message, this_reminder, interval, time_measure)
 
 
 @remindme.command(name="remove_interval", description="Removes an interval from a reminder", brief="Removes an interval from a reminder")
-async def remove_interval(ctx, index: int):
-    this_reminder = await reminder_organizer.get_reminder_with_index(ctx.message, index)
+async def remove_interval(ctx, reminder_id: int):
+    this_reminder = await reminder_organizer.get_reminder_with_id(ctx.message, reminder_id)
     await reminder_organizer.remove_interval(ctx.message, this_reminder)
 
 
-@bot.command(name="noclean", aliases=["nc"], description="Don't clean youtube link", brief="Don't clean youtube link")
+@bot.command(name="noclean", aliases=["nc"], description="Don't clean links", brief="Don't clean links")
 async def noclean(ctx):
     return False
 
@@ -288,132 +340,56 @@ async def count(ctx, how_many: int):
         return await HelperBotFunctions.send_messages(
             [HelperBotFunctions.craft_too_many_warning_message(MAXIMUM_COUNT)], ctx.message.channel)
     for i in range(1, how_many + 1):
-        await HelperBotFunctions.send_messages([f"{i}"], ctx.message.channel)
+        await HelperBotFunctions.send_messages([f"{i}"], ctx.message.channel, priority=MESSAGE_PRIORITY_LOW)
         await asyncio.sleep(1)
 
 
+@admin.command(name="queue", description="Shows how many messages are waiting to be sent", brief="Shows how many messages are waiting to be sent")
+async def queue(ctx):
+    stats = HelperBotDispatcher.dispatcher.get_stats()
+    message = f"Queued messages: {stats.get('queued')} on {stats.get('channels')} channels\n" \
+              f"Longest wait: {stats.get('longest_wait_seconds'):.1f} s\n" \
+              f"Sent: {stats.get('sent')}, sent together with others: {stats.get('coalesced')}\n"
+    for channel_id, how_many in sorted(HelperBotDispatcher.dispatcher.get_channel_backlog().items(),
+                                       key=lambda x: x[1], reverse=True):
+        message += f"{channel_id}: {how_many}\n"
+    await HelperBotFunctions.send_messages([message], ctx.message.channel, make_code_format=True)
+
+
+@admin.command(name="autoclean", description="Shows how long expired messages have waited to be auto cleaned", brief="Shows how long expired messages have waited to be auto cleaned")
+async def autoclean(ctx):
+    lags = auto_cleaner.get_channel_lags()
+    message = f"Auto clean channels: {len(auto_cleaner.get_channels())}, waiting or being cleaned: {len(lags)}\n"
+    for channel_id, lag in sorted(lags.items(), key=lambda x: x[1], reverse=True):
+        message += f"{channel_id}: {lag:.0f} s\n"
+    await HelperBotFunctions.send_messages([message], ctx.message.channel, make_code_format=True)
+
+
+@admin.command(name="reminders", description="Shows how reminder changes are being written to storage", brief="Shows how reminder changes are being written to storage")
+async def reminders(ctx):
+    storage = reminder_organizer.get_storage()
+    if isinstance(storage, HelperBotReminderStorage.WriteBehindReminderStorage):
+        message = f"Reminder changes waiting to be written: {storage.get_queue_depth()}\n" \
+                  f"Writes: {storage.get_flush_count()}, last took {storage.get_last_flush_seconds() * 1000:.1f} ms\n"
+    else:
+        message = f"Reminder changes are written right away to {REMINDER_STORAGE} storage\n"
+    await HelperBotFunctions.send_messages([message], ctx.message.channel, make_code_format=True)
+
+
 # TODO: This
-@admin.command(name="archive", description="Create an archive of this server, if argument \"True\" is given also downloads all attachment files", brief="Create an archive of this server.")
-async def archive(ctx, download_attachments: typing.Optional[bool]):
+@admin.command(name="archive", description="Create an archive of this server, if argument \"True\" is given also downloads all attachment files, if a second \"True\" is given also exports each channel to a json file", brief="Create an archive of this server.")
+async def archive(ctx, download_attachments: typing.Optional[bool], export_json: typing.Optional[bool]):
     message = ctx.message
-    guild = message.guild
-    path_to_guild = PATH_TO_ARCHIVES + os.sep + f"{guild.id}_{guild.name}" + os.sep + \
-                    f"{datetime.strftime(datetime.today(),'%Y-%m-%d_%H%M%S')}"
-    if not os.path.exists(path_to_guild):
-        os.makedirs(path_to_guild)
-    # Create empty file
-    if not os.path.isfile(PATH_TO_ATTACHMENT_ARCHIVE_LOG):
-        with open(PATH_TO_ATTACHMENT_ARCHIVE_LOG, "w", encoding=ENCODING) as file:
-            pass
     if download_attachments:
         await message.channel.send("Archiving server with attachments. This might take a while")
     else:
         await message.channel.send("Archiving server. This might take a while")
     sent_message = await message.channel.send("Archiving")
-    channels = message.guild.text_channels
-    message_amount = 0
-    all_attachments = {}
-    for channel in channels:
-        if channel not in all_attachments:
-            all_attachments[channel] = []
-        await sent_message.edit(content=f"Archiving '{channel.name}'")
-        channel_data = {}
-        messages = channel.history(limit=None, oldest_first=True)
-        async for message_to_archive in messages:
-            message_amount += 1
-            embeds = []
-            # Get info from each embed
-            for embed in message_to_archive.embeds:
-                current_embed = {"title": embed.title, "description": embed.description, "embed_url": embed.url,
-                                 "image_url": embed.image.url, "fields": []}
-                # There can be multiple fields in one embed
-                for field in embed.fields:
-                    current_embed.get("fields").append({field.name: field.value})
-                # Remove empty fields
-                for item in current_embed:
-                    if str(current_embed.get(item)) == "Embed.Empty":
-                        current_embed[item] = ""
-                embeds.append(current_embed)
-            pinned = message_to_archive.pinned
-            reactions = message_to_archive.reactions
-            attachments = []
-            for attachment in message_to_archive.attachments:
-                attachments.append({"attachment_id": attachment.id, "attachment_url": attachment.url,
-                                    "filename": attachment.filename, "size": attachment.size,
-                                    "type": attachment.content_type})
-                all_attachments.get(channel).append({"attachment": attachment, "attachment_id": attachment.id,
-                                                    "attachment_url": attachment.url, "filename": attachment.filename,
-                                                    "size": attachment.size, "type": attachment.content_type})
-            created = datetime.timestamp(message_to_archive.created_at)
-            if message_to_archive.edited_at is not None:
-                edited = datetime.timestamp(message_to_archive.edited_at)
-            else:
-                edited = ""
-            author = message_to_archive.author.name
-            message_id = message_to_archive.id
-            # Add all data to channel data by message id
-            channel_data[message_id] = {
-                'message_id': str(message_id),
-                'created_utc': created,
-                'edited': edited,
-                'created_readable': str(HelperBotFunctions.utc_to_local_datetime(message_to_archive.created_at)),
-                'author': author,
-                'content': message_to_archive.content,
-                'embeds': embeds,
-                'reactions': str(reactions),
-                'attachments': attachments,
-                'pinned': pinned,
-                'raw': str(message_to_archive)
-            }
-        # Write channel's json
-        with open(path_to_guild + os.sep + f"{channel.id}_{channel.name}.json", "w", encoding=ENCODING) as file:
-            json.dump(channel_data, file, indent=2, ensure_ascii=False)
-
-    # Downloading attachments
-    attachment_sizes = 0
-    failed_to_download = 0
-    already_downloaded = []
-    downloaded_attachment_ids = []
-    attachment_ids = []
-    with open(PATH_TO_ATTACHMENT_ARCHIVE_LOG, "r", encoding=ENCODING) as file:
-        for line in file.readlines():
-            attachment_ids.append(line.strip())
-    if download_attachments:
-        for channel in all_attachments:
-            await sent_message.edit(content=f"Downloading attachments for '{channel.name}'")
-            folder_path = PATH_TO_ARCHIVES + os.sep + f"{guild.id}_{guild.name}" + os.sep + "attachments" + \
-                          os.sep + f"{channel.id}_{channel.name}"
-            for attachment in all_attachments.get(channel):
-                attachment_id = attachment.get("attachment_id")
-                # Check if attachment has already been downloaded
-                if str(attachment_id) in attachment_ids:
-                    already_downloaded.append(attachment_id)
-                    continue
-                if not os.path.exists(folder_path):
-                    os.makedirs(folder_path)
-                attachment_filename = attachment.get("filename")
-                extension = f".{attachment_filename.split('.')[-1]}"
-                if attachment_filename.count(".") == 0:
-                    extension = ""
-                file_path = folder_path + os.sep + str(attachment_id) + extension
-                try:
-                    await attachment.get("attachment").save(file_path)
-                    downloaded_attachment_ids.append(f"{attachment_id}\n")
-                    attachment_sizes += attachment.get("size")
-                except:
-                    failed_to_download += 1
-        # Append to file
-        with open(PATH_TO_ATTACHMENT_ARCHIVE_LOG, "a", encoding=ENCODING) as file:
-            file.writelines(downloaded_attachment_ids)
-
+    archiver = HelperBotArchiver.ServerArchiver(bot, message.guild, sent_message)
+    message_to_send = await archiver.archive(bool(download_attachments), bool(export_json))
     await sent_message.delete()
-    message_to_send = f"Archiving of {message_amount} messages"
-    if download_attachments:
-        formatted_size, power_label = HelperBotFunctions.format_bytes(attachment_sizes)
-        message_to_send += f" and {len(downloaded_attachment_ids)} attachments completed with a total size of " \
-                           f"{formatted_size:.2f} {power_label} ({len(already_downloaded)} were already downloaded)"
-        if failed_to_download != 0:
-            message_to_send += f" [{failed_to_download} attachments failed to download]"
     await message.channel.send(message_to_send)
 
 bot.run(token)
+# Write reminder changes that are still waiting
+reminder_organizer.close()
@@ -0,0 +1,437 @@
+import discord
+import argparse
+import asyncio
+import json
+import os
+import re
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from HelperBotConstants import *
+import HelperBotFunctions
+from HelperBotMessageDeleter import RequestBudget
+from HelperBotAttachmentDownloader import AttachmentDownloader
+from HelperBotAttachmentStore import AttachmentStore
+
+# Archived channels are written to files named <channel id>_<channel name>.jsonl, the other .jsonl files are queues
+CHANNEL_FILE_PATTERN = re.compile(r'\d+_.*\.jsonl')
+
+
+def get_message_record(message) -> dict:
+    """
+    Gets the archived data of a message
+    :param message: Message
+    :return: dict
+    """
+    embeds = []
+    # Get info from each embed
+    for embed in message.embeds:
+        current_embed = {"title": embed.title, "description": embed.description, "embed_url": embed.url,
+                         "image_url": embed.image.url, "fields": []}
+        # There can be multiple fields in one embed
+        for field in embed.fields:
+            current_embed.get("fields").append({field.name: field.value})
+        # Remove empty fields
+        for item in current_embed:
+            if str(current_embed.get(item)) == "Embed.Empty":
+                current_embed[item] = ""
+        embeds.append(current_embed)
+    attachments = []
+    for attachment in message.attachments:
+        attachments.append({"attachment_id": attachment.id, "attachment_url": attachment.url,
+                            "filename": attachment.filename, "size": attachment.size,
+                            "type": attachment.content_type})
+    if message.edited_at is not None:
+        edited = datetime.timestamp(message.edited_at)
+    else:
+        edited = ""
+    return {
+        'message_id': str(message.id),
+        'created_utc': datetime.timestamp(message.created_at),
+        'edited': edited,
+        'created_readable': str(HelperBotFunctions.utc_to_local_datetime(message.created_at)),
+        'author': message.author.name,
+        'content': message.content,
+        'embeds': embeds,
+        'reactions': str(message.reactions),
+        'attachments': attachments,
+        'pinned': message.pinned,
+        'raw': str(message)
+    }
+
+
+def iterate_jsonl(file_path: str):
+    """
+    Reads records from a JSON Lines file one at a time
+    :param file_path: str
+    :return: generator, Records
+    """
+    with open(file_path, "r", encoding=ENCODING) as file:
+        for line in file:
+            line = line.strip()
+            if line != "":
+                yield json.loads(line)
+
+
+def export_channel_json(records, json_path: str) -> int:
+    """
+    Exports an archived channel to one json file of messages by message id, one message at a time
+    :param records: iterable, Archived messages of the channel
+    :param json_path: str, File to write
+    :return: int, Amount of messages exported
+    """
+    exported = 0
+    with open(json_path, "w", encoding=ENCODING) as file:
+        file.write("{")
+        for record in records:
+            if exported > 0:
+                file.write(",")
+            # Same layout as json.dump(..., indent=2) of the whole dict
+            record_json = json.dumps(record, indent=2, ensure_ascii=False).replace("\n", "\n  ")
+            file.write(f"\n  {json.dumps(record.get('message_id'))}: {record_json}")
+            exported += 1
+        if exported > 0:
+            file.write("\n")
+        file.write("}")
+    return exported
+
+
+def export_archive_json(path_to_archive: str) -> int:
+    """
+    Exports every archived channel in a folder to json
+    :param path_to_archive: str
+    :return: int, Amount of messages exported
+    """
+    exported = 0
+    for entry in os.scandir(path_to_archive):
+        if entry.is_file() and CHANNEL_FILE_PATTERN.fullmatch(entry.name) is not None:
+            exported += export_channel_json(iterate_jsonl(entry.path), entry.path[:-len(".jsonl")] + ".json")
+    return exported
+
+
+def load_archive_manifest(path_to_server: str) -> dict:
+    """
+    Loads the manifest of a server's incremental archives
+    :param path_to_server: str
+    :return: dict, Segments and last archived message id by channel id
+    """
+    manifest_path = path_to_server + os.sep + ARCHIVE_MANIFEST_FILE
+    if not os.path.isfile(manifest_path):
+        return {"channels": {}}
+    with open(manifest_path, "r", encoding=ENCODING) as file:
+        return json.load(file)
+
+
+def save_archive_manifest(path_to_server: str, manifest: dict) -> None:
+    manifest_path = path_to_server + os.sep + ARCHIVE_MANIFEST_FILE
+    # Write to a temporary file first so the manifest is always whole
+    with open(manifest_path + ".tmp", "w", encoding=ENCODING) as file:
+        json.dump(manifest, file, indent=2, ensure_ascii=False)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def iterate_channel_snapshot(path_to_server: str, channel_manifest: dict):
+    """
+    Reads the current state of a channel from its segments, oldest message first. Each segment has every message after
+    its "after" id as it was when archived, so messages after that id in earlier segments are left out as they were
+    edited, deleted or are in the later segment anyway
+    :param path_to_server: str
+    :param channel_manifest: dict, Channel from the manifest
+    :return: generator, Records
+    """
+    segments = channel_manifest.get("segments")
+    valid_until = []
+    limit = None
+    for segment in reversed(segments):
+        valid_until.append(limit)
+        after = segment.get("after")
+        # A segment without "after" has the whole channel
+        after = 0 if after is None else int(after)
+        limit = after if limit is None else min(limit, after)
+    valid_until.reverse()
+    for segment, until in zip(segments, valid_until):
+        if until == 0:
+            continue
+        for record in iterate_jsonl(path_to_server + os.sep + segment.get("path")):
+            if until is None or int(record.get("message_id")) <= until:
+                yield record
+
+
+def export_snapshot_json(path_to_server: str, output_path: str) -> int:
+    """
+    Exports the current state of every channel in a server's incremental archives to json
+    :param path_to_server: str
+    :param output_path: str, Folder to write to
+    :return: int, Amount of messages exported
+    """
+    exported = 0
+    for channel_id, channel_manifest in load_archive_manifest(path_to_server).get("channels").items():
+        json_path = output_path + os.sep + f"{channel_id}_{channel_manifest.get('name')}.json"
+        exported += export_channel_json(iterate_channel_snapshot(path_to_server, channel_manifest), json_path)
+    return exported
+
+
+class ServerArchiver:
+    """
+    Archives the text channels of a server. Messages are written to disk as they are read, one JSON Lines file per
+    channel, and attachments to download are queued in a file so memory use doesn't grow with the server. Up to
+    ARCHIVE_CONCURRENCY channels are archived at the same time
+    """
+
+    def __init__(self, bot, guild, status_message):
+        self.__bot = bot
+        self.__guild = guild
+        self.__status_message = status_message
+        self.__path_to_server = PATH_TO_ARCHIVES + os.sep + f"{guild.id}_{guild.name}"
+        self.__path_to_archive = self.__path_to_server + os.sep + \
+            f"{datetime.strftime(datetime.today(), '%Y-%m-%d_%H%M%S')}"
+        self.__attachment_queue_path = self.__path_to_archive + os.sep + ARCHIVE_ATTACHMENT_QUEUE_FILE
+        self.__message_amount = 0
+        # Name, state and amount of archived messages by channel id, in the order of the channels
+        self.__channel_names = {}
+        self.__channel_states = {}
+        self.__channel_progress = {}
+        self.__budget = RequestBudget(ARCHIVE_REQUESTS_PER_SECOND)
+        self.__manifest = None
+        if ARCHIVE_INCREMENTAL:
+            self.__manifest = load_archive_manifest(self.__path_to_server)
+
+    def get_path_to_archive(self) -> str:
+        return self.__path_to_archive
+
+    def get_archive_start(self, channel):
+        """
+        Gets after which message a channel is archived in incremental mode. Messages from the last
+        ARCHIVE_RESCAN_HOURS are archived again to catch edits and deletions
+        :param channel: TextChannel
+        :return: int, Message id, None to archive the whole channel
+        """
+        if self.__manifest is None:
+            return None
+        channel_manifest = self.__manifest.get("channels").get(str(channel.id))
+        if channel_manifest is None or channel_manifest.get("last_message_id") is None:
+            return None
+        rescan_start = discord.utils.time_snowflake(datetime.now(timezone.utc) -
+                                                    timedelta(hours=ARCHIVE_RESCAN_HOURS))
+        return min(int(channel_manifest.get("last_message_id")), rescan_start)
+
+    def add_segment(self, channel, file_path: str, after, last_message_id) -> None:
+        """
+        Adds an archived channel file to the manifest
+        :param channel: TextChannel
+        :param file_path: str
+        :param after: int, Message id the file starts after, None if it has the whole channel
+        :param last_message_id: int, Newest message in the channel, None if the channel is empty
+        :return: nothing
+        """
+        channels = self.__manifest.get("channels")
+        if str(channel.id) not in channels:
+            channels[str(channel.id)] = {"segments": []}
+        channel_manifest = channels.get(str(channel.id))
+        channel_manifest["name"] = channel.name
+        if last_message_id is not None:
+            channel_manifest["last_message_id"] = str(last_message_id)
+        channel_manifest.get("segments").append({"path": os.path.relpath(file_path, self.__path_to_server),
+                                                 "after": None if after is None else str(after),
+                                                 "last_message_id": None if last_message_id is None
+                                                 else str(last_message_id)})
+        # Saved after each channel, a channel's segment is only listed once it is complete
+        save_archive_manifest(self.__path_to_server, self.__manifest)
+
+    async def archive_channel(self, channel, attachment_queue) -> int:
+        """
+        Writes the messages of a channel to its JSON Lines file, oldest first. In incremental mode only messages
+        after the previous archive and the rescan window are written
+        :param channel: TextChannel
+        :param attachment_queue: file, Attachments to download are added here, None if they aren't downloaded
+        :return: int, Amount of messages archived
+        """
+        archived = 0
+        after = self.get_archive_start(channel)
+        last_message_id = None
+        manifest_path = self.__path_to_server + os.sep + "attachments" + os.sep + f"{channel.id}_{channel.name}" + \
+            os.sep + ARCHIVE_ATTACHMENT_MANIFEST_FILE
+        file_path = self.__path_to_archive + os.sep + f"{channel.id}_{channel.name}.jsonl"
+        with open(file_path, "w", encoding=ENCODING) as file:
+            await self.__budget.acquire()
+            history = channel.history(limit=None, oldest_first=True,
+                                      after=None if after is None else discord.Object(after))
+            async for message in history:
+                last_message_id = message.id
+                record = get_message_record(message)
+                file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                if attachment_queue is not None:
+                    for attachment in record.get("attachments"):
+                        attachment_queue.write(json.dumps({"manifest_path": manifest_path, **attachment},
+                                                          ensure_ascii=False) + "\n")
+                archived += 1
+                self.__channel_progress[channel.id] = archived
+                # History is fetched 100 messages per request
+                if archived % 100 == 0:
+                    await self.__budget.acquire()
+                # Keep what has been archived on disk in case the archiving is interrupted
+                if archived % ARCHIVE_FLUSH_MESSAGES == 0:
+                    file.flush()
+                    if attachment_queue is not None:
+                        attachment_queue.flush()
+        if self.__manifest is not None:
+            previous_last_id = self.__manifest.get("channels").get(str(channel.id), {}).get("last_message_id")
+            # Nothing new and nothing to check again, the segment would tell nothing
+            if archived == 0 and after is not None and previous_last_id is not None and \
+                    after >= int(previous_last_id):
+                os.remove(file_path)
+            else:
+                # Everything after the start was deleted, continue from the start next time
+                if last_message_id is None and previous_last_id is not None:
+                    last_message_id = min(int(previous_last_id), after)
+                self.add_segment(channel, file_path, after, last_message_id)
+        return archived
+
+    def get_progress_text(self) -> str:
+        """
+        :return: str, How many channels are done and the state of each channel being archived
+        """
+        states = list(self.__channel_states.values())
+        lines = [f"Archived {states.count('done')}/{len(states)} channels, "
+                 f"{sum(self.__channel_progress.values())} messages"]
+        for channel_id, state in self.__channel_states.items():
+            if state == "archiving":
+                lines.append(f"'{self.__channel_names.get(channel_id)}': "
+                             f"{self.__channel_progress.get(channel_id, 0)} messages")
+            elif state in ("no access", "failed"):
+                lines.append(f"'{self.__channel_names.get(channel_id)}': {state}")
+        return "\n".join(lines)[:MESSAGE_MAX_CHARACTERS]
+
+    async def show_progress(self) -> None:
+        """
+        Keeps the status message up to date until cancelled
+        :return: nothing
+        """
+        shown_text = None
+        while True:
+            progress_text = self.get_progress_text()
+            if progress_text != shown_text:
+                await self.__status_message.edit(content=progress_text)
+                shown_text = progress_text
+            await asyncio.sleep(ARCHIVE_PROGRESS_INTERVAL_SECONDS)
+
+    async def archive_channels(self, attachment_queue) -> None:
+        """
+        Archives all text channels with ARCHIVE_CONCURRENCY workers
+        :param attachment_queue: file, Attachments to download are added here, None if they aren't downloaded
+        :return: nothing
+        """
+        channels = deque(self.__guild.text_channels)
+        for channel in channels:
+            self.__channel_names[channel.id] = channel.name
+            self.__channel_states[channel.id] = "waiting"
+
+        async def archive_worker():
+            while len(channels) > 0:
+                channel = channels.popleft()
+                self.__channel_states[channel.id] = "archiving"
+                try:
+                    archived = await self.archive_channel(channel, attachment_queue)
+                    self.__message_amount += archived
+                    self.__channel_states[channel.id] = "done"
+                except discord.errors.Forbidden:
+                    self.__channel_states[channel.id] = "no access"
+                # One channel failing doesn't stop the others. In incremental mode it isn't added to the manifest and is
+                # archived again from the same place next time
+                except (discord.errors.HTTPException, OSError) as error:
+                    print(f"Archiving channel '{channel.name}' failed: {error}")
+                    self.__channel_states[channel.id] = "failed"
+
+        progress_task = asyncio.create_task(self.show_progress())
+        workers = [asyncio.create_task(archive_worker()) for _ in range(ARCHIVE_CONCURRENCY)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            # Anything else stops the whole archive, the other workers are stopped too
+            for worker in workers:
+                worker.cancel()
+            progress_task.cancel()
+
+    async def download_attachments(self) -> AttachmentDownloader:
+        """
+        Downloads the queued attachments of this archive and of earlier archives of the server that were interrupted,
+        and tries again the attachments that failed to download in earlier archives
+        :return: AttachmentDownloader, Has the download statistics
+        """
+        store = AttachmentStore()
+        downloader = AttachmentDownloader(store)
+        queue_paths = []
+        for entry in sorted(os.scandir(self.__path_to_server), key=lambda x: x.name):
+            if not entry.is_dir():
+                continue
+            queue_path = entry.path + os.sep + ARCHIVE_ATTACHMENT_QUEUE_FILE
+            # A queue that wasn't finished writes its own retry queue when it is done
+            if not os.path.isfile(queue_path):
+                queue_path = entry.path + os.sep + ARCHIVE_ATTACHMENT_RETRY_FILE
+            if os.path.isfile(queue_path):
+                queue_paths.append(queue_path)
+        for queue_path in queue_paths:
+            if queue_path == self.__attachment_queue_path:
+                await self.__status_message.edit(content="Downloading attachments")
+            elif os.path.basename(queue_path) == ARCHIVE_ATTACHMENT_RETRY_FILE:
+                await self.__status_message.edit(content="Trying again attachments that failed to download")
+            else:
+                await self.__status_message.edit(content="Continuing an interrupted download of attachments")
+            await downloader.download_queue(queue_path)
+        store.close()
+        return downloader
+
+    async def archive(self, download_attachments=False, export_json=False) -> str:
+        """
+        Archives all text channels of the server
+        :param download_attachments: bool, If true also downloads attachments
+        :param export_json: bool, If true also exports each channel to a json file when done
+        :return: str, Summary of the archive
+        """
+        if not os.path.exists(self.__path_to_archive):
+            os.makedirs(self.__path_to_archive)
+        downloader = None
+        if download_attachments:
+            # The queue is kept until every attachment has been tried, so an interrupted download can continue
+            with open(self.__attachment_queue_path, "w", encoding=ENCODING) as attachment_queue:
+                await self.archive_channels(attachment_queue)
+            downloader = await self.download_attachments()
+        else:
+            await self.archive_channels(None)
+        if export_json:
+            await self.__status_message.edit(content="Exporting json")
+            if self.__manifest is not None:
+                export_snapshot_json(self.__path_to_server, self.__path_to_archive)
+            else:
+                export_archive_json(self.__path_to_archive)
+        message_to_send = f"Archiving of {self.__message_amount} messages"
+        if self.__manifest is not None:
+            message_to_send = f"Archiving of {self.__message_amount} new or recent messages"
+        no_access = list(self.__channel_states.values()).count("no access")
+        if no_access > 0:
+            message_to_send += f" (no access to {no_access} channels)"
+        failed = list(self.__channel_states.values()).count("failed")
+        if failed > 0:
+            message_to_send += f" ({failed} channels failed)"
+        if downloader is not None:
+            formatted_size, power_label = HelperBotFunctions.format_bytes(downloader.get_downloaded_size())
+            message_to_send += f" and {downloader.get_downloaded_amount()} attachments completed with a total size " \
+                               f"of {formatted_size:.2f} {power_label} ({downloader.get_already_downloaded_amount()} " \
+                               f"were already downloaded, {downloader.get_duplicate_amount()} were copies of " \
+                               f"stored files)"
+            if downloader.get_failed_amount() != 0:
+                message_to_send += f" [{downloader.get_failed_amount()} attachments failed to download, " \
+                                   f"{downloader.get_retry_amount()} are tried again on the next archive]"
+        return message_to_send
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exports archived channels from JSON Lines to json files")
+    parser.add_argument("path", help="Folder of one archive, or of a server to export the current state of its "
+                                     "incremental archives")
+    parser.add_argument("--output", help="Folder for the json files of a server, the server's folder by default")
+    arguments = parser.parse_args()
+    if os.path.isfile(arguments.path + os.sep + ARCHIVE_MANIFEST_FILE):
+        exported = export_snapshot_json(arguments.path, arguments.output or arguments.path)
+    else:
+        exported = export_archive_json(arguments.path)
+    print(f"Exported {exported} messages")
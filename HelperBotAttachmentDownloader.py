@@ -0,0 +1,238 @@
+import aiohttp
+import asyncio
+import json
+import os
+from HelperBotConstants import *
+from HelperBotAttachmentStore import AttachmentStore, hash_file
+
+# Responses that are worth trying again, others mean the attachment can't be downloaded
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+def get_manifest_path(attachment: dict) -> str:
+    """
+    :param attachment: dict, Attachment from a queue file
+    :return: str, Manifest of the attachment's channel
+    """
+    if attachment.get("manifest_path") is None:
+        # Queues written before the attachment store have the file path instead
+        return os.path.dirname(attachment.get("file_path")) + os.sep + ARCHIVE_ATTACHMENT_MANIFEST_FILE
+    return attachment.get("manifest_path")
+
+
+def iterate_attachment_queue(file_path: str):
+    """
+    Reads attachments from a queue file one at a time
+    :param file_path: str
+    :return: generator, Attachment dicts
+    """
+    with open(file_path, "r", encoding=ENCODING) as file:
+        for line in file:
+            line = line.strip()
+            if line != "":
+                yield json.loads(line)
+
+
+def write_attachment_queue(file_path: str, attachments: list) -> None:
+    """
+    Writes attachments to a queue file, the file is replaced only when it has been written completely
+    :param file_path: str
+    :param attachments: list, Attachment dicts
+    :return: nothing
+    """
+    with open(file_path + ".tmp", "w", encoding=ENCODING) as file:
+        for attachment in attachments:
+            file.write(json.dumps(attachment, ensure_ascii=False) + "\n")
+    os.replace(file_path + ".tmp", file_path)
+
+
+class AttachmentDownloader:
+    """
+    Downloads attachments listed in queue files, ARCHIVE_DOWNLOAD_CONCURRENCY at a time. Files are downloaded to a
+    .part file, an interrupted download continues from where it was left. Downloaded attachments are added to the
+    AttachmentStore, which keeps each different file once, and listed in the manifest of their channel. Attachments that
+    fail every try are written to a retry queue next to the queue file
+    """
+
+    def __init__(self, store=None, concurrency=ARCHIVE_DOWNLOAD_CONCURRENCY, retries=ARCHIVE_DOWNLOAD_RETRIES,
+                 backoff_seconds=ARCHIVE_DOWNLOAD_BACKOFF_SECONDS):
+        if store is None:
+            store = AttachmentStore()
+        self.__store = store
+        self.__concurrency = concurrency
+        self.__retries = retries
+        self.__backoff_seconds = backoff_seconds
+        self.__downloaded_amount = 0
+        self.__already_downloaded_amount = 0
+        self.__duplicate_amount = 0
+        self.__failed_amount = 0
+        self.__retry_amount = 0
+        self.__downloaded_size = 0
+
+    def get_downloaded_amount(self) -> int:
+        return self.__downloaded_amount
+
+    def get_already_downloaded_amount(self) -> int:
+        return self.__already_downloaded_amount
+
+    def get_duplicate_amount(self) -> int:
+        """
+        :return: int, Downloaded attachments whose file was already stored
+        """
+        return self.__duplicate_amount
+
+    def get_failed_amount(self) -> int:
+        return self.__failed_amount
+
+    def get_retry_amount(self) -> int:
+        """
+        :return: int, Failed attachments that are tried again on the next archive
+        """
+        return self.__retry_amount
+
+    def get_downloaded_size(self) -> int:
+        return self.__downloaded_size
+
+    async def download_file(self, session, url: str, part_path: str, size=None) -> bool:
+        """
+        Downloads a file, trying again with exponential backoff if the connection fails or the server is busy
+        :param session: aiohttp.ClientSession
+        :param url: str
+        :param part_path: str, Where the file is saved, an existing file is continued
+        :param size: int, Expected size in bytes, checked if given
+        :return: bool, True if the file was downloaded
+        """
+        for attempt in range(self.__retries + 1):
+            if attempt > 0:
+                await asyncio.sleep(self.__backoff_seconds * 2 ** (attempt - 1))
+            headers = {}
+            offset = 0
+            if os.path.isfile(part_path):
+                offset = os.path.getsize(part_path)
+            # Continue a download that was interrupted
+            if offset > 0:
+                headers["Range"] = f"bytes={offset}-"
+            try:
+                async with session.get(url, headers=headers) as response:
+                    if response.status == 416:
+                        # The part file doesn't match the file anymore, start over
+                        os.remove(part_path)
+                        continue
+                    if response.status in RETRY_STATUSES:
+                        continue
+                    if response.status >= 400:
+                        print(f"Failed to download {url}: {response.status} {response.reason}")
+                        return False
+                    # Servers that don't support ranges send the whole file
+                    mode = "ab" if response.status == 206 else "wb"
+                    with open(part_path, mode) as file:
+                        async for chunk in response.content.iter_chunked(ARCHIVE_DOWNLOAD_CHUNK_BYTES):
+                            file.write(chunk)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                continue
+            if size is not None and os.path.getsize(part_path) != size:
+                os.remove(part_path)
+                continue
+            return True
+        print(f"Failed to download {url} after {self.__retries + 1} tries")
+        return False
+
+    async def download_queue(self, queue_path: str) -> None:
+        """
+        Downloads the attachments of a queue file that haven't been downloaded yet. Attachments that failed are written
+        to ARCHIVE_ATTACHMENT_RETRY_FILE in the queue's folder, then the queue is marked done by renaming it. A retry
+        queue is replaced by the attachments that failed again
+        :param queue_path: str
+        :return: nothing
+        """
+        failed = []
+        # Bounded so the queue file is read only as fast as attachments are downloaded
+        pending = asyncio.Queue(maxsize=self.__concurrency * 2)
+        timeout = aiohttp.ClientTimeout(total=ARCHIVE_DOWNLOAD_TIMEOUT_SECONDS)
+        loop = asyncio.get_running_loop()
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+
+            async def download_worker():
+                while True:
+                    attachment = await pending.get()
+                    if attachment is None:
+                        return
+                    attachment_id = str(attachment.get("attachment_id"))
+                    part_path = self.__store.get_part_path(attachment_id)
+                    try:
+                        if not await self.download_file(session, attachment.get("attachment_url"), part_path,
+                                                        attachment.get("size")):
+                            self.__failed_amount += 1
+                            failed.append(attachment)
+                            continue
+                        # Hashing big files takes a while, don't block the bot meanwhile
+                        sha256 = await loop.run_in_executor(None, hash_file, part_path)
+                        # Added right away so a restart doesn't download it again
+                        if self.__store.add_attachment(attachment_id, attachment.get("filename"), part_path,
+                                                       sha256):
+                            self.__downloaded_size += attachment.get("size")
+                        else:
+                            self.__duplicate_amount += 1
+                        self.write_manifest_entry(attachment, sha256)
+                    except OSError as error:
+                        print(f"Failed to save attachment {attachment_id}: {error}")
+                        self.__failed_amount += 1
+                        failed.append(attachment)
+                        continue
+                    self.__downloaded_amount += 1
+
+            workers = [asyncio.create_task(download_worker()) for _ in range(self.__concurrency)]
+            try:
+                for attachment in iterate_attachment_queue(queue_path):
+                    # Check if attachment has already been downloaded
+                    if self.__store.has_attachment(attachment.get("attachment_id")):
+                        self.__already_downloaded_amount += 1
+                        continue
+                    await pending.put(attachment)
+                for _ in workers:
+                    await pending.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                for worker in workers:
+                    worker.cancel()
+        self.write_retry_queue(queue_path, failed)
+        if os.path.basename(queue_path) != ARCHIVE_ATTACHMENT_RETRY_FILE:
+            os.replace(queue_path, queue_path + ".done")
+
+    def write_retry_queue(self, queue_path: str, failed: list) -> None:
+        """
+        Lists attachments that failed to download so the next archive tries them again
+        :param queue_path: str, Queue file the attachments were in
+        :param failed: list, Attachment dicts
+        :return: nothing
+        """
+        retry_path = os.path.dirname(queue_path) + os.sep + ARCHIVE_ATTACHMENT_RETRY_FILE
+        retry = []
+        for attachment in failed:
+            attachment = dict(attachment)
+            attachment["retry_runs"] = attachment.get("retry_runs", 0) + 1
+            if attachment.get("retry_runs") > ARCHIVE_DOWNLOAD_RETRY_RUNS:
+                print(f"Giving up on attachment {attachment.get('attachment_id')} after "
+                      f"{ARCHIVE_DOWNLOAD_RETRY_RUNS} retries")
+                continue
+            retry.append(attachment)
+        if len(retry) > 0:
+            write_attachment_queue(retry_path, retry)
+            self.__retry_amount += len(retry)
+        elif os.path.isfile(retry_path):
+            os.remove(retry_path)
+
+    def write_manifest_entry(self, attachment: dict, sha256: str) -> None:
+        """
+        Adds a downloaded attachment to the manifest of its channel
+        :param attachment: dict, Attachment from a queue file
+        :param sha256: str, Hash of the attachment's file
+        :return: nothing
+        """
+        manifest_path = get_manifest_path(attachment)
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        entry = {"attachment_id": str(attachment.get("attachment_id")), "filename": attachment.get("filename"),
+                 "size": attachment.get("size"), "type": attachment.get("type"), "sha256": sha256,
+                 "blob_path": self.__store.get_blob_path(sha256)}
+        with open(manifest_path, "a", encoding=ENCODING) as file:
+            file.write(json.dumps(entry, ensure_ascii=False) + "\n")
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import sqlite3
+from HelperBotConstants import *
+
+
+def hash_file(file_path: str) -> str:
+    """
+    Gets the SHA-256 of a file, reading it in chunks
+    :param file_path: str
+    :return: str, Hex digest
+    """
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(ARCHIVE_DOWNLOAD_CHUNK_BYTES), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+class AttachmentStore:
+    """
+    Index of downloaded attachments by attachment id and by content hash. Each different file is kept once in
+    PATH_TO_ATTACHMENT_BLOBS named by its hash, archives point to the files with per-channel manifests
+    """
+
+    def __init__(self, path=PATH_TO_ATTACHMENT_DATABASE, blob_path=PATH_TO_ATTACHMENT_BLOBS):
+        self.__blob_path = blob_path
+        os.makedirs(blob_path + os.sep + "tmp", exist_ok=True)
+        self.__connection = sqlite3.connect(path, timeout=30)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        with self.__connection:
+            # sha256 is NULL for attachments downloaded before the store, their files are in the old folders
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS attachments (attachment_id TEXT PRIMARY KEY, "
+                                      "sha256 TEXT, filename TEXT, size INTEGER)")
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS blobs (sha256 TEXT PRIMARY KEY, "
+                                      "size INTEGER NOT NULL)")
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.migrate_from_log()
+
+    def migrate_from_log(self, log_path=PATH_TO_ATTACHMENT_ARCHIVE_LOG) -> int:
+        """
+        Adds attachment ids from the old attachment log, only done once
+        :param log_path: str
+        :return: int, Amount of attachment ids added
+        """
+        if self.__connection.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_log'").fetchone() is not None:
+            return 0
+        migrated = 0
+        with self.__connection:
+            if os.path.isfile(log_path):
+                with open(log_path, "r", encoding=ENCODING) as file:
+                    attachment_ids = [(line.strip(),) for line in file if line.strip() != ""]
+                self.__connection.executemany("INSERT OR IGNORE INTO attachments (attachment_id) VALUES (?)",
+                                              attachment_ids)
+                migrated = len(attachment_ids)
+            self.__connection.execute("INSERT INTO meta (key, value) VALUES ('migrated_from_log', ?)",
+                                      (str(migrated),))
+        return migrated
+
+    def has_attachment(self, attachment_id) -> bool:
+        return self.__connection.execute("SELECT 1 FROM attachments WHERE attachment_id = ?",
+                                         (str(attachment_id),)).fetchone() is not None
+
+    def get_blob_path(self, sha256: str) -> str:
+        """
+        :param sha256: str
+        :return: str, Where the file with this hash is kept
+        """
+        return self.__blob_path + os.sep + sha256[:2] + os.sep + sha256
+
+    def get_part_path(self, attachment_id) -> str:
+        """
+        :param attachment_id: str/int
+        :return: str, Where the attachment is downloaded before it is added
+        """
+        return self.__blob_path + os.sep + "tmp" + os.sep + f"{attachment_id}.part"
+
+    def add_attachment(self, attachment_id, filename: str, file_path: str, sha256: str) -> bool:
+        """
+        Adds a downloaded attachment, its file is moved to the blobs or removed if the same file is already stored
+        :param attachment_id: str/int
+        :param filename: str, Original name of the attachment
+        :param file_path: str, Downloaded file
+        :param sha256: str, Hash of the file
+        :return: bool, True if the file wasn't stored before
+        """
+        size = os.path.getsize(file_path)
+        is_new = self.__connection.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha256,)).fetchone() is None
+        if is_new:
+            blob_path = self.get_blob_path(sha256)
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(file_path, blob_path)
+        else:
+            os.remove(file_path)
+        with self.__connection:
+            self.__connection.execute("INSERT OR IGNORE INTO blobs (sha256, size) VALUES (?, ?)", (sha256, size))
+            self.__connection.execute("INSERT OR REPLACE INTO attachments (attachment_id, sha256, filename, size) "
+                                      "VALUES (?, ?, ?, ?)", (str(attachment_id), sha256, filename, size))
+        return is_new
+
+    def close(self) -> None:
+        self.__connection.close()
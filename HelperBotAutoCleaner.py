@@ -1,41 +1,297 @@
 import discord
 import datetime
 import asyncio
+import heapq
+import json
+import os
 import re
+import time
+from collections import deque
 from dateutil.relativedelta import relativedelta
-from HelperBotConstants import AUTO_CLEAN_PREFIX
+from HelperBotConstants import AUTO_CLEAN_PREFIX, AUTO_CLEAN_RETRY_SECONDS, AUTO_CLEAN_CONCURRENCY, \
+    AUTO_CLEAN_REQUESTS_PER_SECOND, ENCODING, PATH_TO_AUTO_CLEAN_WATERMARKS
+from HelperBotMessageDeleter import BulkDeleter, RequestBudget
+
+AUTO_CLEAN_PATTERN = re.compile(rf"{AUTO_CLEAN_PREFIX}(\d+)")
+
+
+def get_auto_clean_hours(channel):
+    """
+    Gets how many hours messages are kept on a channel
+    :param channel: GuildChannel
+    :return: int, None if the channel isn't auto cleaned
+    """
+    if not isinstance(channel, discord.TextChannel) or channel.topic is None:
+        return None
+    re_match = AUTO_CLEAN_PATTERN.search(str(channel.topic))
+    if re_match is None:
+        return None
+    return int(re_match.group(1))
+
 
 class AutoCleaner:
     def __init__(self, bot):
         self.__bot = bot
         self.__started = False
+        # Hours to keep messages by channel id, for channels with AUTO_CLEAN= in their topic
+        self.__channels = {}
+        # Next time each channel has expired messages, channels without a time have nothing to clean
+        self.__next_due = {}
+        # Min-heap of (timestamp, channel id), entries not matching __next_due are skipped
+        self.__due_queue = []
+        self.__queue_changed = asyncio.Event()
+        # Due channel ids waiting for a worker by guild id, guilds take turns so one can't hold up the others
+        self.__guild_queues = {}
+        self.__guild_turns = deque()
+        self.__work_available = asyncio.Semaphore(0)
+        self.__workers = []
+        # When the oldest expired message expired by channel id, for channels waiting or being cleaned
+        self.__expired_since = {}
+        self.__budget = RequestBudget(AUTO_CLEAN_REQUESTS_PER_SECOND)
+        # Last checked message id and ids of pinned messages before it by channel id, so each clean only needs to go
+        # through messages that are new since the last one
+        self.__watermarks = {}
+        # Channels whose stored pinned message ids have been checked since the last pin update
+        self.__pins_checked = set()
+        if os.path.isfile(PATH_TO_AUTO_CLEAN_WATERMARKS):
+            with open(PATH_TO_AUTO_CLEAN_WATERMARKS, "r", encoding=ENCODING) as file:
+                self.__watermarks = json.load(file)
+
+    def save_watermarks(self):
+        with open(PATH_TO_AUTO_CLEAN_WATERMARKS + ".tmp", "w", encoding=ENCODING) as file:
+            json.dump(self.__watermarks, file)
+        os.replace(PATH_TO_AUTO_CLEAN_WATERMARKS + ".tmp", PATH_TO_AUTO_CLEAN_WATERMARKS)
 
     def get_started(self):
         return self.__started
 
+    def get_channels(self):
+        return self.__channels
+
+    def get_channel_lags(self):
+        """
+        Gets how long expired messages have waited to be deleted on channels that are waiting or being cleaned
+        :return: dict, Seconds by channel id
+        """
+        now = time.time()
+        return {channel_id: max(0.0, now - expired) for channel_id, expired in self.__expired_since.items()}
+
+    def set_due(self, channel_id, timestamp):
+        """
+        Sets when a channel should be cleaned next
+        :param channel_id: int
+        :param timestamp: float, None if there's nothing to clean
+        :return: nothing
+        """
+        if timestamp is None:
+            self.__next_due.pop(channel_id, None)
+            return
+        self.__next_due[channel_id] = timestamp
+        heapq.heappush(self.__due_queue, (timestamp, channel_id))
+        if self.__due_queue[0] == (timestamp, channel_id):
+            self.__queue_changed.set()
+
+    def update_channel(self, channel):
+        """
+        Adds, updates or removes a channel in the auto clean registry based on its topic
+        :param channel: GuildChannel
+        :return: nothing
+        """
+        time_in_hours = get_auto_clean_hours(channel)
+        if time_in_hours is None:
+            self.remove_channel(channel.id)
+            return
+        if self.__channels.get(channel.id) == time_in_hours:
+            return
+        self.__channels[channel.id] = time_in_hours
+        # Clean right away, the retention time is new or changed
+        self.set_due(channel.id, time.time())
+
+    def remove_channel(self, channel_id):
+        self.__channels.pop(channel_id, None)
+        self.__pins_checked.discard(channel_id)
+        self.set_due(channel_id, None)
+        if self.__watermarks.pop(str(channel_id), None) is not None:
+            self.save_watermarks()
+
+    def add_guild(self, guild):
+        for channel in guild.text_channels:
+            self.update_channel(channel)
+
+    def remove_guild(self, guild):
+        for channel in guild.channels:
+            self.remove_channel(channel.id)
+
+    def note_message(self, message):
+        """
+        Schedules a clean for when a new message expires, if the channel has nothing to clean before that
+        :param message: Message
+        :return: nothing
+        """
+        channel_id = message.channel.id
+        if channel_id not in self.__channels or channel_id in self.__next_due:
+            return
+        self.set_due(channel_id, message.created_at.timestamp() + self.__channels.get(channel_id) * 3600)
+
+    def note_pins_update(self, channel_id):
+        """
+        Makes the next clean check if the channel's pinned messages are still pinned
+        :param channel_id: int
+        :return: nothing
+        """
+        self.__pins_checked.discard(channel_id)
+
+    async def check_pins(self, channel, pinned_ids, deleter):
+        """
+        Deletes messages that were pinned in earlier cleans but aren't pinned anymore. The channel's pins are listed
+        once, a stored message missing from the list is fetched and only deleted when it says it isn't pinned
+        :param channel: TextChannel
+        :param pinned_ids: set, Stored pinned message ids, unpinned and missing ones are removed
+        :param deleter: BulkDeleter
+        :return: nothing
+        """
+        current_pins = set()
+        await self.__budget.acquire()
+        async for message in channel.pins(limit=None):
+            current_pins.add(message.id)
+            # Pins are fetched 50 per request
+            if len(current_pins) % 50 == 0:
+                await self.__budget.acquire()
+        for message_id in sorted(pinned_ids - current_pins):
+            await self.__budget.acquire()
+            try:
+                message = await channel.fetch_message(message_id)
+            except discord.errors.NotFound:
+                pinned_ids.discard(message_id)
+                continue
+            if not message.pinned:
+                pinned_ids.discard(message_id)
+                await deleter.add(message)
+
+    async def clean_channel(self, channel, time_in_hours):
+        """
+        Deletes unpinned messages older than time_in_hours from a channel, messages young enough are deleted in bulk
+        :param channel: TextChannel
+        :param time_in_hours: int
+        :return: float, Timestamp when the oldest kept message expires, None if there are none
+        """
+        start = time.perf_counter()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        oldest_allowed = now - relativedelta(hours=time_in_hours)
+        deleter = BulkDeleter(channel, self.__budget)
+        watermark = dict(self.__watermarks.get(str(channel.id), {}))
+        pinned_ids = set(watermark.get("pinned", []))
+        # Messages that were pinned in earlier cleans might have been unpinned since, only checked after a pin update
+        # or once after starting because updates might have been missed while offline
+        if channel.id not in self.__pins_checked:
+            # Pin updates during the check make the next clean check again
+            self.__pins_checked.add(channel.id)
+            if len(pinned_ids) > 0:
+                await self.check_pins(channel, pinned_ids, deleter)
+        after = None
+        if watermark.get("last_checked") is not None:
+            after = discord.Object(watermark.get("last_checked"))
+        messages_before = channel.history(before=oldest_allowed, after=after, oldest_first=True, limit=None)
+        checked = 0
+        await self.__budget.acquire()
+        async for message in messages_before:
+            watermark["last_checked"] = message.id
+            checked += 1
+            # History is fetched 100 messages per request
+            if checked % 100 == 0:
+                await self.__budget.acquire()
+            if message.pinned:
+                pinned_ids.add(message.id)
+                continue
+            await deleter.add(message)
+        await deleter.flush()
+        deleted_in_bulk = deleter.get_deleted_in_bulk()
+        deleted_one_by_one = deleter.get_deleted_one_by_one()
+        watermark["pinned"] = sorted(pinned_ids)
+        if watermark != self.__watermarks.get(str(channel.id)):
+            self.__watermarks[str(channel.id)] = watermark
+            self.save_watermarks()
+        if deleted_in_bulk + deleted_one_by_one > 0:
+            print(f"Auto clean of '{channel.name}': deleted {deleted_in_bulk} messages in bulk and "
+                  f"{deleted_one_by_one} one by one, kept {len(pinned_ids)} pinned in "
+                  f"{time.perf_counter() - start:.1f} s (lag {self.get_channel_lags().get(channel.id, 0.0):.0f} s)")
+        await self.__budget.acquire()
+        async for message in channel.history(after=oldest_allowed, oldest_first=True, limit=None):
+            if not message.pinned:
+                return message.created_at.timestamp() + time_in_hours * 3600
+        return None
+
+    def queue_clean(self, channel_id, expired):
+        """
+        Queues a due channel for the cleaning workers
+        :param channel_id: int
+        :param expired: float, When the channel's oldest message expired
+        :return: nothing
+        """
+        channel = self.__bot.get_channel(channel_id)
+        # Channels already waiting or being cleaned get a new due time when their clean is done
+        if channel is None or channel_id not in self.__channels or channel_id in self.__expired_since:
+            return
+        self.__expired_since[channel_id] = expired
+        guild_id = channel.guild.id
+        if guild_id not in self.__guild_queues:
+            self.__guild_queues[guild_id] = deque()
+            self.__guild_turns.append(guild_id)
+        self.__guild_queues.get(guild_id).append(channel_id)
+        self.__work_available.release()
+
+    async def clean_worker(self):
+        """
+        Cleans queued channels, taking one channel from each guild in turn
+        :return: nothing
+        """
+        while True:
+            await self.__work_available.acquire()
+            guild_id = self.__guild_turns.popleft()
+            guild_queue = self.__guild_queues.get(guild_id)
+            channel_id = guild_queue.popleft()
+            if len(guild_queue) > 0:
+                self.__guild_turns.append(guild_id)
+            else:
+                del self.__guild_queues[guild_id]
+            next_due = time.time() + AUTO_CLEAN_RETRY_SECONDS
+            try:
+                channel = self.__bot.get_channel(channel_id)
+                if channel is not None and channel_id in self.__channels:
+                    next_due = await self.clean_channel(channel, self.__channels.get(channel_id))
+            except (discord.errors.Forbidden, discord.errors.HTTPException):
+                pass
+            except Exception as error:
+                print(f"Failed to clean channel {channel_id}: {error}")
+            finally:
+                del self.__expired_since[channel_id]
+            if channel_id in self.__channels:
+                self.set_due(channel_id, next_due)
+
     async def start(self):
         if self.__started:
             return
         self.__started = True
-        re_pattern = rf"{AUTO_CLEAN_PREFIX}(\d+)"
+        for guild in self.__bot.guilds:
+            self.add_guild(guild)
+        for _ in range(AUTO_CLEAN_CONCURRENCY):
+            self.__workers.append(asyncio.create_task(self.clean_worker()))
         while True:
-            for guild in self.__bot.guilds:
-                for channel in guild.text_channels:
-                    try:
-                        description = channel.topic
-                        if description is None:
-                            continue
-                        re_match = re.search(re_pattern, str(description))
-                        if re_match is None:
-                            continue
-                        time_in_hours = int(re_match.group(1))
-                        oldest_allowed = datetime.datetime.now() - relativedelta(hours=time_in_hours)
-                        messages_before = channel.history(before=oldest_allowed, limit=None)
-                        async for message in messages_before:
-                            if message.pinned:
-                                continue
-                            print(f"Deleting: {message.id}")
-                            await message.delete()
-                    except (discord.errors.Forbidden, discord.errors.HTTPException):
-                        continue
-            await asyncio.sleep(3600)
+            self.__queue_changed.clear()
+            # Drop entries that have been rescheduled or removed
+            while len(self.__due_queue) > 0 and \
+                    self.__next_due.get(self.__due_queue[0][1]) != self.__due_queue[0][0]:
+                heapq.heappop(self.__due_queue)
+            if len(self.__due_queue) < 1:
+                await self.__queue_changed.wait()
+                continue
+            delay = self.__due_queue[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.__queue_changed.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            expired, channel_id = heapq.heappop(self.__due_queue)
+            del self.__next_due[channel_id]
+            self.queue_clean(channel_id, expired)
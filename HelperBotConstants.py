@@ -4,15 +4,63 @@ from datetime import datetime
 COMMAND_PREFIX = "!"
 
 EMBED_MESSAGE_MAX_CHARACTERS = 2048
+# One message can have this many embeds with this many characters in them together
+EMBEDS_PER_MESSAGE = 10
+EMBED_TOTAL_MAX_CHARACTERS = 6000
 MESSAGE_MAX_CHARACTERS = 2000
+# Outgoing messages to the same channel are sent in order of priority, lower first
+MESSAGE_PRIORITY_HIGH = 0
+MESSAGE_PRIORITY_NORMAL = 1
+MESSAGE_PRIORITY_LOW = 2
 MAXIMUM_REMINDERS = 200
 MAXIMUM_REMOVED_MESSAGES = 5000
+# Discord deletes at most 100 messages at once and only ones younger than 14 days, leave a minute of margin
+BULK_DELETE_MAX_MESSAGES = 100
+BULK_DELETE_MAX_AGE_SECONDS = 14 * 24 * 60 * 60 - 60
+# How often the progress message of a delete command is updated and how long the result is shown
+DELETE_PROGRESS_INTERVAL_SECONDS = 2
+DELETE_RESULT_SECONDS = 10
 MAXIMUM_RANDOM_MESSAGES = 20
 # One hour
 MINIMUM_INTERVAL_SECONDS = 60 * 60
 MAXIMUM_COUNT = 1000
-MAXIMUM_FAILED_COUNT = 10
+# A reminder that can't be sent is retried after REMINDER_RETRY_SECONDS, doubling up to REMINDER_RETRY_MAX_SECONDS
+# between retries, and removed after MAXIMUM_FAILED_COUNT retries, which takes about 12 hours
+MAXIMUM_FAILED_COUNT = 20
+REMINDER_RETRY_SECONDS = 10
+REMINDER_RETRY_MAX_SECONDS = 60 * 60
+# Wake up at least once an hour in case the system clock has changed
+REMINDER_MAX_SLEEP_SECONDS = 60 * 60
+# How many reminders can be sent at the same time (reminders to the same channel are always sent in order)
+REMINDER_SEND_CONCURRENCY = 10
+# What to do when an interval reminder has missed occurrences, e.g. after downtime. In every case the reminder is moved
+# to its next occurrence in the future
+# "skip": send it once, "coalesce": send it once and tell how many were missed,
+# "replay": send it once for each missed occurrence, at most INTERVAL_REPLAY_LIMIT times
+INTERVAL_CATCH_UP_POLICY = "coalesce"
+INTERVAL_REPLAY_LIMIT = 5
+# At most this many reminders are listed on a page, fewer if they don't fit in one embed
+REMINDER_LIST_PAGE_SIZE = 5
+# How long the page buttons of a reminder list work
+REMINDER_LIST_TIMEOUT_SECONDS = 5 * 60
+# If true the bot only handles reminder commands and reminders are sent by HelperBotReminderWorker.py processes, each
+# owning an even share of REMINDER_SHARD_COUNT shards of users
+REMINDER_SHARDED = False
+REMINDER_SHARD_COUNT = 16
+# Shards of a worker that hasn't renewed its leases for this long are taken over by other workers
+REMINDER_SHARD_LEASE_SECONDS = 30
+REMINDER_SHARD_HEARTBEAT_SECONDS = 10
+# Processes sharing reminders only read the reminders changed since their last sync, from a log of the latest changes.
+# A process that falls further behind than this reloads all of its reminders
+REMINDER_CHANGE_LOG_SIZE = 100000
 ENCODING = "utf-8"
+# "sqlite" stores all reminders in PATH_TO_REMINDER_DATABASE, "json" uses one file per user in PATH_TO_REMINDERS
+REMINDER_STORAGE = "sqlite"
+# Reminder changes are collected for this long and then written together, 0 writes every change right away
+REMINDER_WRITE_DELAY_SECONDS = 2
+REMINDER_LOAD_THREADS = 8
+# How many reminders are built at startup before letting other events run
+REMINDER_LOAD_BATCH_SIZE = 1000
 
 EPOCH_DATETIME = datetime(1970, 1, 1)
 SECONDS_PER_DAY = 24 * 60 * 60
@@ -20,11 +68,12 @@ BORN_DATE = datetime.fromisoformat("2020-03-19T11:27:00")
 DATE_FORMAT = "%a %Y-%m-%d %H:%M:%S"
 
 LIST_OF_COMMANDS = {f"{COMMAND_PREFIX}delete x": "This command deletes x amount of messages",
-                    f"{COMMAND_PREFIX}noclean": "I will automatically clean youtube links unless the message starts with this command",
+                    f"{COMMAND_PREFIX}delete cancel": "Stop deleting messages on this channel",
+                    f"{COMMAND_PREFIX}noclean": "I will automatically clean links unless the message starts with this command",
                     f"{COMMAND_PREFIX}count x": "I will count to x with about a second between messages. Use !count stop to stop counting",
                     f"{COMMAND_PREFIX}remindme / {COMMAND_PREFIX}reminder \nx [Time Measure] \nOR\ndd.mm.yyyy_hh:mm[:ss]\nOR\ntomorrow/today_hh.mm[.ss]": "I will remind you in x amount of [Time Measures]",
                     f"{COMMAND_PREFIX}remindme / {COMMAND_PREFIX}reminder list": "List your reminders",
-                    f"{COMMAND_PREFIX}remindme / {COMMAND_PREFIX}reminder delete / remove x": "Delete reminder at index x",
+                    f"{COMMAND_PREFIX}remindme / {COMMAND_PREFIX}reminder delete / remove x": "Delete reminder with id x",
                     f"{COMMAND_PREFIX}timemeasures": "Get a list of time measures",
                     f"{COMMAND_PREFIX}answer": "I will try to answer your question",
                     f"{COMMAND_PREFIX}roll": "Roll a roulette",
@@ -35,7 +84,7 @@ LIST_OF_COMMANDS = {f"{COMMAND_PREFIX}delete x": "This command deletes x amount
                     }
 LIST_OF_TASKS = ["I will tag you if you tag me",
                  "I will react like you do",
-                 "I will automatically clean youtube links unless the message starts !noclean"
+                 "I will automatically clean links unless the message starts !noclean"
                  ]
 LIST_OF_TIME_MEASURES = {"seconds": ["sec", "secs", "second", "seconds"],
                          "minutes": ["min", "mins", "minute", "minutes"],
@@ -45,29 +94,90 @@ LIST_OF_TIME_MEASURES = {"seconds": ["sec", "secs", "second", "seconds"],
                          "months": ["month", "months"],
                          "years": ["year", "years"]
                          }
+# Time measure by each of its aliases, e.g. "mins" -> "minutes"
+TIME_MEASURE_ALIASES = {alias: time_name for time_name in LIST_OF_TIME_MEASURES
+                        for alias in LIST_OF_TIME_MEASURES.get(time_name)}
+# Only used to estimate how many interval occurrences have passed
+APPROXIMATE_TIME_UNIT_SECONDS = {"seconds": 1, "minutes": 60, "hours": 60 * 60, "days": SECONDS_PER_DAY,
+                                 "weeks": 7 * SECONDS_PER_DAY, "months": 30.436875 * SECONDS_PER_DAY,
+                                 "years": 365.2425 * SECONDS_PER_DAY}
 REMINDER_HELP = (f"Correct formats are: (using !remindme / !reminder)\n"
                  f"{COMMAND_PREFIX}remindme [in/time] [x] [Time Measure]\n"
                  f"{COMMAND_PREFIX}remindme [on/at/date] [dd.mm.yyyy/tomorrow/today hh.mm.ss]\n"
                  f"{COMMAND_PREFIX}remindme [list]\n"
-                 f"{COMMAND_PREFIX}remindme [remove/delete] [index]\n"
-                 f"{COMMAND_PREFIX}remindme [interval/add_interval/every] [index] [x] [Time Measure]\n"
-                 f"{COMMAND_PREFIX}remindme [remove_interval] [index]\n"
+                 f"{COMMAND_PREFIX}remindme [remove/delete] [id]\n"
+                 f"{COMMAND_PREFIX}remindme [interval/add_interval/every] [id] [x] [Time Measure]\n"
+                 f"{COMMAND_PREFIX}remindme [remove_interval] [id]\n"
                  f"{COMMAND_PREFIX}remindme [help]\n\n"
                  f"To get a list of time measures, try\n"
                  f"{COMMAND_PREFIX}remindme [timemeasures]")
 ADMIN_HELP = (
-    f"{COMMAND_PREFIX}archive [true]: Creates an archive of this server, if argument \"true\" is given downloads all attachment files\n"
+    f"{COMMAND_PREFIX}archive [true] [true]: Creates an archive of this server, if argument \"true\" is given downloads all attachment files, if a second \"true\" is given also exports each channel to a json file\n"
     f"{COMMAND_PREFIX}count x: I will count to x with about a second between messages. Use !count stop to stop counting\n"
+    f"{COMMAND_PREFIX}admin queue: Shows how many messages are waiting to be sent\n"
+    f"{COMMAND_PREFIX}admin autoclean: Shows how long expired messages have waited to be auto cleaned\n"
+    f"{COMMAND_PREFIX}admin reminders: Shows how reminder changes are being written to storage\n"
     f"{COMMAND_PREFIX}admin help\n")
 
 ADMIN_ROLE = "Admin"
 
 REMOVE_FROM_LINK = ["list", "index"]
+# Link cleaning rules by host, rules of a host also apply to its subdomains and rules of "*" apply to every link
+# "remove": Query parameters to remove, a name ending with * removes all parameters starting with it
+# "canonical": Rewrites links to one form, one of LINK_CANONICALIZERS in HelperBotFunctions.py
+LINK_CLEANING_RULES = {"*": {"remove": ["utm_*", "fbclid", "gclid", "igshid", "mc_eid"]},
+                       "youtube.com": {"remove": REMOVE_FROM_LINK + ["si", "pp", "feature"],
+                                       "canonical": "youtube_shorts"},
+                       "youtu.be": {"canonical": "youtu_be"},
+                       "open.spotify.com": {"remove": ["si"]}
+                       }
+# How many recently cleaned links are remembered
+LINK_CLEANING_CACHE_SIZE = 4096
 AUTO_CLEAN_PREFIX = "AUTO_CLEAN="
+# When to try again if cleaning a channel fails
+AUTO_CLEAN_RETRY_SECONDS = 60 * 60
+# How many channels are cleaned at the same time
+AUTO_CLEAN_CONCURRENCY = 4
+# Requests per second for all auto cleaning together, Discord's global limit is 50 for the whole bot
+AUTO_CLEAN_REQUESTS_PER_SECOND = 20
 
 PATH_TO_DISCORD = "Discord"
 PATH_TO_DATA = PATH_TO_DISCORD + os.sep + "data"
 PATH_TO_REMINDERS = PATH_TO_DATA + os.sep + "reminders"
+PATH_TO_REMINDER_DATABASE = PATH_TO_DATA + os.sep + "reminders.db"
+# Shard leases are kept apart from the reminders, heartbeats would otherwise look like changed reminders
+PATH_TO_REMINDER_SHARD_DATABASE = PATH_TO_DATA + os.sep + "reminder_shards.db"
 PATH_TO_TOKEN = PATH_TO_DISCORD + os.sep + "HelperBoyToken.env"
 PATH_TO_ATTACHMENT_ARCHIVE_LOG = PATH_TO_DATA + os.sep + "archive_attachment.log"
 PATH_TO_ARCHIVES = PATH_TO_DATA + os.sep + "archives"
+# Downloaded attachments by id and content hash, each different file is kept once in PATH_TO_ATTACHMENT_BLOBS
+PATH_TO_ATTACHMENT_DATABASE = PATH_TO_DATA + os.sep + "attachments.db"
+PATH_TO_ATTACHMENT_BLOBS = PATH_TO_ARCHIVES + os.sep + "blobs"
+PATH_TO_AUTO_CLEAN_WATERMARKS = PATH_TO_DATA + os.sep + "auto_clean_watermarks.json"
+# Attachments found while archiving are listed in this file in the archive's folder
+ARCHIVE_ATTACHMENT_QUEUE_FILE = "attachment_queue.jsonl"
+# Attachments that failed to download are listed in this file in the same folder and tried again on the next archive,
+# at most ARCHIVE_DOWNLOAD_RETRY_RUNS times
+ARCHIVE_ATTACHMENT_RETRY_FILE = "attachment_retry.jsonl"
+ARCHIVE_DOWNLOAD_RETRY_RUNS = 5
+# Lists the downloaded attachments of a channel and where their files are, in the channel's attachment folder
+ARCHIVE_ATTACHMENT_MANIFEST_FILE = "manifest.jsonl"
+# In incremental mode each archive only has the messages sent after the previous archive of the server, and the
+# messages of the last ARCHIVE_RESCAN_HOURS again to catch edits and deletions. The manifest in the server's archive
+# folder lists the files that together have each channel
+ARCHIVE_INCREMENTAL = True
+ARCHIVE_RESCAN_HOURS = 24
+ARCHIVE_MANIFEST_FILE = "manifest.json"
+# Archived messages are flushed to disk after this many messages
+ARCHIVE_FLUSH_MESSAGES = 1000
+# How many channels are archived at the same time and how many requests per second they make together
+ARCHIVE_CONCURRENCY = 4
+ARCHIVE_REQUESTS_PER_SECOND = 20
+ARCHIVE_PROGRESS_INTERVAL_SECONDS = 2
+# How many attachments are downloaded at the same time, and how many times a failed download is tried again, waiting
+# ARCHIVE_DOWNLOAD_BACKOFF_SECONDS before the first retry and twice as long before each next one
+ARCHIVE_DOWNLOAD_CONCURRENCY = 4
+ARCHIVE_DOWNLOAD_RETRIES = 5
+ARCHIVE_DOWNLOAD_BACKOFF_SECONDS = 1
+ARCHIVE_DOWNLOAD_TIMEOUT_SECONDS = 5 * 60
+ARCHIVE_DOWNLOAD_CHUNK_BYTES = 64 * 1024
@@ -0,0 +1,123 @@
+import asyncio
+import heapq
+import itertools
+import time
+from HelperBotConstants import MESSAGE_MAX_CHARACTERS, MESSAGE_PRIORITY_NORMAL
+
+
+class OutboundMessage:
+    """
+    A message waiting to be sent, its future is resolved with the sent message
+    """
+
+    def __init__(self, send_kwargs: dict, future):
+        self.send_kwargs = send_kwargs
+        self.future = future
+        self.queued = time.monotonic()
+
+    def can_coalesce(self) -> bool:
+        """
+        :return: bool, True if this is plain text that can be sent together with other plain text
+        """
+        return list(self.send_kwargs.keys()) == ["content"]
+
+
+class MessageDispatcher:
+    """
+    Sends all outgoing messages through one queue per channel. Messages to a channel are sent one at a time, in order of
+    priority and then in the order they were queued. Adjacent plain text messages are sent together when they fit
+    """
+
+    def __init__(self):
+        # Heap of (priority, order, OutboundMessage) by channel id
+        self.__queues = {}
+        self.__tasks = {}
+        self.__order = itertools.count()
+        self.__sent_count = 0
+        self.__coalesced_count = 0
+
+    def queue_message(self, channel, priority=MESSAGE_PRIORITY_NORMAL, **send_kwargs):
+        """
+        Queues a message to a channel
+        :param channel: Messageable
+        :param priority: int, Lower is sent first
+        :param send_kwargs: Arguments for channel.send
+        :return: Future, Resolves with the sent message or raises what sending raised
+        """
+        loop = asyncio.get_running_loop()
+        message = OutboundMessage(send_kwargs, loop.create_future())
+        if channel.id not in self.__queues:
+            self.__queues[channel.id] = []
+        heapq.heappush(self.__queues.get(channel.id), (priority, next(self.__order), message))
+        if channel.id not in self.__tasks:
+            self.__tasks[channel.id] = loop.create_task(self.__send_channel(channel))
+        return message.future
+
+    async def send(self, channel, list_of_kwargs: list, priority=MESSAGE_PRIORITY_NORMAL):
+        """
+        Queues messages to a channel and waits until they are sent
+        :param channel: Messageable
+        :param list_of_kwargs: list, Arguments for channel.send for each message
+        :param priority: int, Lower is sent first
+        :return: list, Sent messages, raises the first error if some couldn't be sent
+        """
+        futures = [self.queue_message(channel, priority, **send_kwargs) for send_kwargs in list_of_kwargs]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
+
+    async def __send_channel(self, channel):
+        queue = self.__queues.get(channel.id)
+        try:
+            while len(queue) > 0:
+                _, _, first = heapq.heappop(queue)
+                batch = [first]
+                if first.can_coalesce():
+                    length = len(first.send_kwargs.get("content"))
+                    while len(queue) > 0 and queue[0][2].can_coalesce() and \
+                            length + 1 + len(queue[0][2].send_kwargs.get("content")) <= MESSAGE_MAX_CHARACTERS:
+                        _, _, message = heapq.heappop(queue)
+                        length += 1 + len(message.send_kwargs.get("content"))
+                        batch.append(message)
+                send_kwargs = first.send_kwargs
+                if len(batch) > 1:
+                    send_kwargs = {"content": "\n".join(message.send_kwargs.get("content") for message in batch)}
+                    self.__coalesced_count += len(batch) - 1
+                try:
+                    sent_message = await channel.send(**send_kwargs)
+                except Exception as error:
+                    for message in batch:
+                        if not message.future.done():
+                            message.future.set_exception(error)
+                    continue
+                self.__sent_count += 1
+                for message in batch:
+                    if not message.future.done():
+                        message.future.set_result(sent_message)
+        finally:
+            del self.__queues[channel.id]
+            del self.__tasks[channel.id]
+
+    def get_stats(self) -> dict:
+        """
+        :return: dict, Queued messages, channels with queued messages, longest wait in seconds, messages sent and
+        messages that were sent together with an earlier one
+        """
+        now = time.monotonic()
+        oldest = min((message.queued for queue in self.__queues.values() for _, _, message in queue), default=now)
+        return {"queued": sum(len(queue) for queue in self.__queues.values()),
+                "channels": len(self.__queues),
+                "longest_wait_seconds": now - oldest,
+                "sent": self.__sent_count,
+                "coalesced": self.__coalesced_count}
+
+    def get_channel_backlog(self) -> dict:
+        """
+        :return: dict, Amount of queued messages by channel id
+        """
+        return {channel_id: len(queue) for channel_id, queue in self.__queues.items() if len(queue) > 0}
+
+
+dispatcher = MessageDispatcher()
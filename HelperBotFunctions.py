@@ -1,3 +1,4 @@
+import functools
 import re
 from urllib.parse import urlsplit, urlunsplit
 from dateutil.relativedelta import relativedelta
@@ -5,6 +6,12 @@ from HelperBotConstants import *
 from HelperBotCustomizations import *
 import discord
 import time
+from HelperBotDispatcher import dispatcher
+
+# Links end at whitespace, brackets and quotes. Punctuation and markdown like ||spoiler|| or **bold** at the end belong
+# to the text around the link
+URL_PATTERN = re.compile(r'https?://[^\s<>()\[\]"\']+')
+URL_TRAILING_PUNCTUATION = ".,!?:;|*_~"
 
 
 def make_dirs():
@@ -48,59 +55,115 @@ def craft_message_link(server_id, channel_id, message_id):
     return f"https://discord.com/channels/{server_id}/{channel_id}/{message_id}"
 
 
-def craft_correct_length_messages(list_of_message_pieces, embed_message=False, make_code_format=False):
+def find_message_split(text, start, end):
     """
-    Crafts a list with messages that don't exceed MESSAGE_MAX_CHARACTERS
-    :param list_of_message_pieces: list
+    Finds where to split text that doesn't fit in a message, preferring line breaks and then spaces
+    :param text: str
+    :param start: int, Where the message starts in text
+    :param end: int, Where the message would end at the latest
+    :return: int, Index after the last character of the message
+    """
+    for separator in ("\n", " "):
+        index = text.rfind(separator, start, end)
+        if index > start:
+            return index + 1
+    return end
+
+
+def iterate_correct_length_messages(list_of_message_pieces, embed_message=False, make_code_format=False):
+    """
+    Joins message pieces into messages that don't exceed MESSAGE_MAX_CHARACTERS, pieces that are too long for one
+    message are split on line breaks or spaces
+    :param list_of_message_pieces: iterable
     :param embed_message: bool, If true, will use EMBED_MESSAGE_MAX_CHARACTERS instead of MESSAGE_MAX_CHARACTERS
     :param make_code_format: bool, If true will add ``` characters in the end and start of the message
-    :return: list
+    :return: generator, Messages
     """
-    current_message = ""
-    list_of_new_pieces = []
     max_characters = MESSAGE_MAX_CHARACTERS
     if embed_message:
         max_characters = EMBED_MESSAGE_MAX_CHARACTERS
+    prefix = ""
+    suffix = ""
     if make_code_format:
         max_characters -= 6
+        prefix = "```"
+        suffix = "```"
+    current_pieces = []
+    current_length = 0
     for piece in list_of_message_pieces:
         piece = str(piece)
-        # Make sure this one message alone doesn't exceed max character length
-        if len(piece) > max_characters:
-            piece = piece[:max_characters]
-        # If current and previous messages exceed max length, add crafted message to list
-        if (len(piece) + len(current_message)) >= max_characters:
-            # If current message is empty, don't add it
-            if current_message != "":
-                list_of_new_pieces.append(current_message)
-            # Clear current_message
-            current_message = ""
-        # Add this message to current_message
-        current_message += piece
-    list_of_new_pieces.append(current_message)
-    if make_code_format:
-        list_of_formatted_pieces = []
-        for message in list_of_new_pieces:
-            list_of_formatted_pieces.append(f"```{message}```")
-        return list_of_formatted_pieces
-    return list_of_new_pieces
+        # Start a new message if this piece doesn't fit in the current one
+        if current_length + len(piece) > max_characters and current_length > 0:
+            yield prefix + "".join(current_pieces) + suffix
+            current_pieces = []
+            current_length = 0
+        start = 0
+        # Split pieces that are too long for one message, using indexes so the piece is copied only once
+        while len(piece) - start > max_characters:
+            end = find_message_split(piece, start, start + max_characters)
+            yield prefix + piece[start:end] + suffix
+            start = end
+        if start > 0:
+            piece = piece[start:]
+        if len(piece) > 0:
+            current_pieces.append(piece)
+            current_length += len(piece)
+    if current_length > 0:
+        yield prefix + "".join(current_pieces) + suffix
+
+
+def craft_correct_length_messages(list_of_message_pieces, embed_message=False, make_code_format=False):
+    """
+    Crafts a list with messages that don't exceed MESSAGE_MAX_CHARACTERS
+    :param list_of_message_pieces: list
+    :param embed_message: bool, If true, will use EMBED_MESSAGE_MAX_CHARACTERS instead of MESSAGE_MAX_CHARACTERS
+    :param make_code_format: bool, If true will add ``` characters in the end and start of the message
+    :return: list
+    """
+    return list(iterate_correct_length_messages(list_of_message_pieces, embed_message, make_code_format))
 
 
-async def send_messages(list_of_messages, channel, make_code_format=False):
+def pack_embeds(embeds):
+    """
+    Packs embeds in order into as few messages as possible, keeping under EMBEDS_PER_MESSAGE and
+    EMBED_TOTAL_MAX_CHARACTERS in each message
+    :param embeds: list, discord.Embeds
+    :return: list, Lists of embeds, one for each message
+    """
+    groups = []
+    current_group = []
+    current_length = 0
+    for embed in embeds:
+        # len() of an embed counts all of its texts like Discord does
+        embed_length = len(embed)
+        if len(current_group) >= EMBEDS_PER_MESSAGE or current_length + embed_length > EMBED_TOTAL_MAX_CHARACTERS:
+            if len(current_group) > 0:
+                groups.append(current_group)
+            current_group = []
+            current_length = 0
+        current_group.append(embed)
+        current_length += embed_length
+    if len(current_group) > 0:
+        groups.append(current_group)
+    return groups
+
+
+async def send_messages(list_of_messages, channel, make_code_format=False, priority=MESSAGE_PRIORITY_NORMAL):
     """
     Sends all messages in a list to a given channel
     :param list_of_messages: list
     :param channel: channel
     :param make_code_format: bool, If true will add ``` characters in the end and start of the message
+    :param priority: int, MESSAGE_PRIORITY_HIGH/NORMAL/LOW, messages with higher priority to the same channel go first
     :return: nothing
     """
     list_of_messages = craft_correct_length_messages(list_of_messages, make_code_format=make_code_format)
-    for message in list_of_messages:
-        await channel.send(message)
+    await dispatcher.send(channel, [{"content": message} for message in list_of_messages], priority)
 
 
 async def send_embed_messages(list_of_messages, channel, title, content="",
-                              colour=discord.Colour.from_rgb(255, 255, 255), make_code_format=False):
+                              colour=discord.Colour.from_rgb(255, 255, 255), make_code_format=False,
+                              priority=MESSAGE_PRIORITY_NORMAL):
     """
     Sends all messages in a list to a given channel as embed messages
     :param list_of_messages: list
@@ -109,56 +172,166 @@ async def send_embed_messages(list_of_messages, channel, title, content="",
     :param content: str, Content of the actual message
     :param colour: discord.Colour, Colour of the embed, Black by default
     :param make_code_format: bool, If true will add ``` characters in the end and start of the message
+    :param priority: int, MESSAGE_PRIORITY_HIGH/NORMAL/LOW, messages with higher priority to the same channel go first
     :return: nothing
     """
     list_of_messages = craft_correct_length_messages(list_of_messages, embed_message=True,
                                                      make_code_format=make_code_format)
+    embeds = []
     for message in list_of_messages:
         embed = discord.Embed(title=title,
                               description=message, colour=colour)
-        await channel.send(content=content, embed=embed)
+        embeds.append(embed)
+    await dispatcher.send(channel, [{"content": content, "embeds": group} for group in pack_embeds(embeds)], priority)
+
+
+def canonicalize_youtu_be(split_url):
+    """
+    Rewrites youtu.be/id to youtube.com/watch?v=id
+    :param split_url: SplitResult
+    :return: SplitResult, None if the link isn't a video
+    """
+    video_id = split_url.path.strip("/")
+    if video_id == "" or "/" in video_id:
+        return None
+    query = f"v={video_id}"
+    if split_url.query != "":
+        query += f"&{split_url.query}"
+    return split_url._replace(netloc="www.youtube.com", path="/watch", query=query)
+
+
+def canonicalize_youtube_shorts(split_url):
+    """
+    Rewrites youtube.com/shorts/id to youtube.com/watch?v=id
+    :param split_url: SplitResult
+    :return: SplitResult, None if the link isn't a short
+    """
+    if not split_url.path.startswith("/shorts/"):
+        return None
+    video_id = split_url.path[len("/shorts/"):].strip("/")
+    if video_id == "" or "/" in video_id:
+        return None
+    query = f"v={video_id}"
+    if split_url.query != "":
+        query += f"&{split_url.query}"
+    return split_url._replace(path="/watch", query=query)
+
+
+LINK_CANONICALIZERS = {"youtu_be": canonicalize_youtu_be, "youtube_shorts": canonicalize_youtube_shorts}
+
+
+class LinkRule:
+    """
+    Compiled cleaning rule of one host
+    """
+
+    def __init__(self, removed_parameters, canonical=None):
+        self.removed_names = frozenset(name for name in removed_parameters if not name.endswith("*"))
+        self.removed_prefixes = tuple(name[:-1] for name in removed_parameters if name.endswith("*"))
+        self.canonicalize = LINK_CANONICALIZERS.get(canonical)
+
+    def is_removed(self, parameter):
+        """
+        :param parameter: str, Query parameter, e.g. "list=xyz"
+        :return: bool, True if the parameter should be removed
+        """
+        name = parameter.split("=", 1)[0]
+        return name in self.removed_names or name.startswith(self.removed_prefixes)
+
+
+def compile_link_rules(rules):
+    """
+    Compiles link cleaning rules, rules of "*" are added to the rules of every host
+    :param rules: dict, Rules by host, see LINK_CLEANING_RULES
+    :return: dict, LinkRules by host, "*" for hosts without rules of their own
+    """
+    common_removed = rules.get("*", {}).get("remove", [])
+    compiled_rules = {}
+    for host, rule in rules.items():
+        removed = list(common_removed)
+        if host != "*":
+            removed += rule.get("remove", [])
+        compiled_rules[host.lower()] = LinkRule(removed, rule.get("canonical"))
+    if "*" not in compiled_rules:
+        compiled_rules["*"] = LinkRule([])
+    return compiled_rules
 
 
-def clean_youtube_links(message_content):
+LINK_RULES = compile_link_rules(LINK_CLEANING_RULES)
+
+
+def get_link_rule(host):
+    """
+    Gets the rule of a host, or of its closest parent domain with a rule
+    :param host: str, e.g. "music.youtube.com"
+    :return: LinkRule
+    """
+    host = host.lower()
+    if host.startswith("www."):
+        host = host[len("www."):]
+    while True:
+        rule = LINK_RULES.get(host)
+        if rule is not None:
+            return rule
+        dot_index = host.find(".")
+        if dot_index < 0:
+            return LINK_RULES.get("*")
+        host = host[dot_index + 1:]
+
+
+@functools.lru_cache(maxsize=LINK_CLEANING_CACHE_SIZE)
+def clean_url(url):
     """
-    Cleans lists and indexes from youtube links from messages
+    Cleans a link with the rule of its host. Parameters that aren't removed are kept as they are
+    :param url: str
+    :return: str, Cleaned link, the same link if nothing was changed
+    """
+    try:
+        split_url = urlsplit(url)
+    except ValueError:
+        return url
+    rule = get_link_rule(split_url.hostname or "")
+    changed = False
+    if rule.canonicalize is not None:
+        canonical_url = rule.canonicalize(split_url)
+        if canonical_url is not None:
+            split_url = canonical_url
+            rule = get_link_rule(split_url.hostname or "")
+            changed = True
+    if split_url.query != "":
+        parameters = split_url.query.split("&")
+        kept_parameters = [parameter for parameter in parameters if not rule.is_removed(parameter)]
+        if len(kept_parameters) != len(parameters):
+            split_url = split_url._replace(query="&".join(kept_parameters))
+            changed = True
+    if not changed:
+        return url
+    return urlunsplit(split_url)
+
+
+def clean_link_match(url_match):
+    """
+    Cleans a link found by URL_PATTERN, punctuation and markdown at its end are kept as they are
+    :param url_match: re.Match
+    :return: str, Cleaned link
+    """
+    url = url_match.group(0)
+    link = url.rstrip(URL_TRAILING_PUNCTUATION)
+    return clean_url(link) + url[len(link):]
+
+
+def clean_links(message_content):
+    """
+    Cleans links in messages with LINK_CLEANING_RULES, e.g. lists and indexes from youtube links
     :param message_content: str, Given message content
     :return: str, New message content with links cleaned
     """
+    # Most messages have no links, skip them before doing anything else
+    if "://" not in message_content:
+        return message_content
     if message_content.startswith(f"{COMMAND_PREFIX}noclean") or message_content.startswith(f"{COMMAND_PREFIX}nc"):
         return message_content
-    # Find youtube urls
-    urls = re.findall(r'(https?://[\S]*youtu[\S]+)', message_content)
-    new_urls = []
-    for url in urls:
-        url = urlsplit(url)
-        query = url.query
-        split_char = "&"
-        # If there are no split characters, continue
-        # if query.count(split_char) == 0:
-        #     continue
-        for banned in REMOVE_FROM_LINK:
-            # Find e.g. &list=xyz&
-            #                                   &           list  =test_493r  &
-            found_part = re.search(f"(?P<part>{split_char}?{banned}=[\w\d_]+[{split_char}\s]?)", query)
-            if found_part is not None:
-                found_part = found_part.group("part")
-            # If nothing was found, continue
-            else:
-                continue
-            # If there are 2 split characters, remove one of them
-            if found_part.count(split_char) > 1:
-                found_part = found_part.replace(split_char, "", 1)
-            # Remove found part from query
-            query = query.replace(found_part, "")
-        new_url = urlunsplit(url)
-        new_url = new_url.replace(url.query, query)
-        new_urls.append(new_url)
-    new_message_content = message_content
-    # Replace urls with new ones
-    for url, new_url in zip(urls, new_urls):
-        new_message_content = new_message_content.replace(url, new_url)
-    return new_message_content
+    return URL_PATTERN.sub(clean_link_match, message_content)
 
 
 def get_history_message():
@@ -0,0 +1,220 @@
+import discord
+import asyncio
+import datetime
+import time
+from HelperBotConstants import BULK_DELETE_MAX_MESSAGES, BULK_DELETE_MAX_AGE_SECONDS, COMMAND_PREFIX, \
+    DELETE_PROGRESS_INTERVAL_SECONDS, DELETE_RESULT_SECONDS
+
+
+class RequestBudget:
+    """
+    Token bucket that limits how many requests per second are made by everyone sharing it
+    """
+
+    def __init__(self, requests_per_second):
+        self.__requests_per_second = requests_per_second
+        self.__tokens = requests_per_second
+        self.__updated = time.monotonic()
+        self.__lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.__lock:
+            while True:
+                now = time.monotonic()
+                self.__tokens = min(self.__requests_per_second,
+                                    self.__tokens + (now - self.__updated) * self.__requests_per_second)
+                self.__updated = now
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.__tokens) / self.__requests_per_second)
+
+
+class BulkDeleter:
+    """
+    Deletes messages from one channel. Messages young enough are collected and deleted BULK_DELETE_MAX_MESSAGES at a
+    time, older ones and ones in private channels are deleted one by one
+    """
+
+    def __init__(self, channel, budget=None):
+        self.__channel = channel
+        self.__budget = budget
+        # Only guild channels can delete in bulk
+        self.__can_bulk = isinstance(channel, discord.abc.GuildChannel)
+        self.__batch = []
+        self.__deleted_in_bulk = 0
+        self.__deleted_one_by_one = 0
+
+    def get_deleted_in_bulk(self):
+        return self.__deleted_in_bulk
+
+    def get_deleted_one_by_one(self):
+        return self.__deleted_one_by_one
+
+    def get_deleted_count(self):
+        return self.__deleted_in_bulk + self.__deleted_one_by_one
+
+    async def wait_for_budget(self):
+        if self.__budget is not None:
+            await self.__budget.acquire()
+
+    def get_oldest_bulk_deletable(self):
+        # Discord only deletes messages younger than two weeks in bulk
+        return datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=BULK_DELETE_MAX_AGE_SECONDS)
+
+    async def add(self, message):
+        """
+        Deletes a message now or adds it to the next bulk deletion
+        :param message: Message
+        :return: nothing
+        """
+        if self.__can_bulk and message.created_at > self.get_oldest_bulk_deletable():
+            self.__batch.append(message)
+            if len(self.__batch) >= BULK_DELETE_MAX_MESSAGES:
+                await self.flush()
+            return
+        # History is read newest first, so every message after this one is deleted one by one too. Delete the
+        # collected messages now before they get too old while waiting
+        await self.flush()
+        await self.delete_one(message)
+
+    async def delete_one(self, message):
+        await self.wait_for_budget()
+        try:
+            await message.delete()
+            self.__deleted_one_by_one += 1
+        except discord.errors.NotFound:
+            pass
+
+    async def flush(self):
+        """
+        Deletes the collected messages, ones that got too old for bulk deletion while collected are deleted one by one
+        :return: nothing
+        """
+        if len(self.__batch) < 1:
+            return
+        batch, self.__batch = self.__batch, []
+        oldest_bulk_deletable = self.get_oldest_bulk_deletable()
+        for message in batch:
+            if message.created_at <= oldest_bulk_deletable:
+                await self.delete_one(message)
+        batch = [message for message in batch if message.created_at > oldest_bulk_deletable]
+        if len(batch) < 1:
+            return
+        await self.wait_for_budget()
+        await self.__channel.delete_messages(batch)
+        self.__deleted_in_bulk += len(batch)
+
+
+class DeleteJob:
+    """
+    Deletes the given amount of messages sent before its progress message and keeps the progress message up to date
+    """
+
+    def __init__(self, channel, author, how_many, only_from=None):
+        self.__channel = channel
+        self.__author = author
+        self.__how_many = how_many
+        # Only delete messages by this user id, used in private channels where only own messages can be deleted
+        self.__only_from = only_from
+        self.__deleter = BulkDeleter(channel)
+        self.__progress_message = None
+        self.__checked = 0
+        self.__cancelled = False
+
+    def get_author(self):
+        return self.__author
+
+    def cancel(self):
+        self.__cancelled = True
+
+    def get_progress_text(self):
+        return f"Deleting messages: deleted {self.__deleter.get_deleted_count()}, checked {self.__checked} of " \
+               f"{self.__how_many}. Use {COMMAND_PREFIX}delete cancel to stop."
+
+    def get_result_text(self):
+        deleted = self.__deleter.get_deleted_count()
+        if self.__cancelled:
+            return f"Deleting cancelled after deleting {deleted} messages."
+        return f"Deleted {deleted} messages ({self.__deleter.get_deleted_in_bulk()} in bulk, " \
+               f"{self.__deleter.get_deleted_one_by_one()} one by one)."
+
+    async def run(self):
+        self.__progress_message = await self.__channel.send(self.get_progress_text())
+        last_update = time.monotonic()
+        result_text = None
+        try:
+            # History is streamed once, the progress message itself is newer than everything to delete
+            async for message in self.__channel.history(limit=self.__how_many, before=self.__progress_message):
+                if self.__cancelled:
+                    break
+                self.__checked += 1
+                if self.__only_from is None or message.author.id == self.__only_from:
+                    await self.__deleter.add(message)
+                if time.monotonic() - last_update >= DELETE_PROGRESS_INTERVAL_SECONDS:
+                    await self.__progress_message.edit(content=self.get_progress_text())
+                    last_update = time.monotonic()
+            # Collected messages are left alone if the job was cancelled
+            if not self.__cancelled:
+                await self.__deleter.flush()
+        except discord.errors.Forbidden:
+            result_text = f"I don't have permission to delete messages here. Deleted " \
+                          f"{self.__deleter.get_deleted_count()} messages."
+        except discord.errors.HTTPException as error:
+            result_text = f"Deleting stopped: {error.text}. Deleted {self.__deleter.get_deleted_count()} messages."
+        if result_text is None:
+            result_text = self.get_result_text()
+        await self.__progress_message.edit(content=result_text, delete_after=DELETE_RESULT_SECONDS)
+
+
+class MessageDeleter:
+    """
+    Runs delete jobs in the background, one per channel at a time
+    """
+
+    def __init__(self):
+        # Running jobs by channel id
+        self.__jobs = {}
+        self.__tasks = set()
+
+    def get_job(self, channel_id):
+        return self.__jobs.get(channel_id)
+
+    def start_job(self, channel, author, how_many, only_from=None):
+        """
+        Starts deleting messages from a channel in the background
+        :param channel: Messageable
+        :param author: User, Who started the job
+        :param how_many: int, How many of the latest messages are checked
+        :param only_from: int, Only delete messages by this user id
+        :return: DeleteJob, None if a job is already running on the channel
+        """
+        if channel.id in self.__jobs:
+            return None
+        job = DeleteJob(channel, author, how_many, only_from)
+        self.__jobs[channel.id] = job
+        task = asyncio.create_task(self.__run_job(channel.id, job))
+        # Keep a reference so the task isn't garbage collected while running
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+        return job
+
+    async def __run_job(self, channel_id, job):
+        try:
+            await job.run()
+        except Exception as error:
+            print(f"Delete job on channel {channel_id} failed: {error}")
+        finally:
+            del self.__jobs[channel_id]
+
+    def cancel_job(self, channel_id):
+        """
+        Cancels the job running on a channel
+        :param channel_id: int
+        :return: bool, True if there was a job to cancel
+        """
+        job = self.__jobs.get(channel_id)
+        if job is None:
+            return False
+        job.cancel()
+        return True
@@ -1,12 +1,31 @@
 import discord
 from discord.ext import commands
 import asyncio
+import bisect
+import functools
+import heapq
+import itertools
+from collections import deque
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 import dateutil.parser
-import json
+import sys
+import time
 from HelperBotConstants import *
 import HelperBotFunctions
+import HelperBotReminderStorage
+from HelperBotReminderShards import get_shard
+
+
+@functools.lru_cache(maxsize=256)
+def get_relativedelta(time_amount: int, time_unit: str) -> relativedelta:
+    """
+    Gets a cached relativedelta, they are never modified after creation
+    :param time_amount: int, Amount of time_units
+    :param time_unit: str, Key of LIST_OF_TIME_MEASURES, e.g. minutes
+    :return: relativedelta
+    """
+    return relativedelta(**{time_unit: time_amount})
 
 
 def get_date_with_delta(time_amount, time_measure, now=None):
@@ -19,21 +38,56 @@ def get_date_with_delta(time_amount, time_measure, now=None):
     """
     if now is None:
         now = datetime.now()
-    correct_time_measure = None
     # Verify that valid time measure is used
-    for time_name in LIST_OF_TIME_MEASURES:
-        if time_measure in LIST_OF_TIME_MEASURES.get(time_name):
-            correct_time_measure = time_name
-    if correct_time_measure is None:
+    time_unit = TIME_MEASURE_ALIASES.get(time_measure)
+    if time_unit is None:
         return
     try:
-        time_measure_to_use = {correct_time_measure: time_amount}
-        notify_time = datetime.timestamp(now + relativedelta(**time_measure_to_use))
-    except OSError:
+        notify_time = datetime.timestamp(now + get_relativedelta(time_amount, time_unit))
+    except (OSError, OverflowError, ValueError):
         return
     return notify_time
 
 
+def get_next_occurrence(timestamp, time_amount, time_measure, now=None):
+    """
+    Gets the first occurrence of an interval that is after now, without stepping through the missed ones
+    :param timestamp: float, Timestamp of an earlier occurrence
+    :param time_amount: int, Amount of time_measures
+    :param time_measure: str, E.g. seconds, mins
+    :param now: float, Timestamp to compare to, current time by default
+    :return: (float, int), Timestamp of the next occurrence and how many occurrences were missed,
+    None if invalid parameters
+    """
+    time_unit = TIME_MEASURE_ALIASES.get(time_measure)
+    if time_unit is None or time_amount <= 0:
+        return
+    if now is None:
+        now = datetime.now().timestamp()
+    start = datetime.fromtimestamp(timestamp)
+    # Estimate the amount of steps and then correct for month lengths and daylight saving time
+    steps = max(1, int((now - timestamp) // (APPROXIMATE_TIME_UNIT_SECONDS.get(time_unit) * time_amount)) + 1)
+    try:
+        while steps > 1 and datetime.timestamp(start + get_relativedelta(time_amount * (steps - 1), time_unit)) > now:
+            steps -= 1
+        next_timestamp = datetime.timestamp(start + get_relativedelta(time_amount * steps, time_unit))
+        while next_timestamp <= now:
+            steps += 1
+            next_timestamp = datetime.timestamp(start + get_relativedelta(time_amount * steps, time_unit))
+    except (OSError, OverflowError, ValueError):
+        return
+    return next_timestamp, steps - 1
+
+
+def get_retry_delay(failed_count: int) -> float:
+    """
+    Gets how long to wait before sending a reminder again, doubling with each failure
+    :param failed_count: int, How many times sending has failed before
+    :return: float, Seconds to wait
+    """
+    return min(REMINDER_RETRY_SECONDS * 2 ** failed_count, REMINDER_RETRY_MAX_SECONDS)
+
+
 def get_valid_date(reminder_date, reminder_time):
     """
     Parses a date from date and time
@@ -54,90 +108,86 @@ def get_valid_date(reminder_date, reminder_time):
     return real_date
 
 
-def get_reminders():
-    """
-    Returns reminders as dictionary
-    :return: dict
-    """
-    all_reminders = {}
-    if len(os.listdir(PATH_TO_REMINDERS)) < 1:
-        return {}
-    for reminder_file_name in os.listdir(PATH_TO_REMINDERS):
-        with open(PATH_TO_REMINDERS + os.sep + reminder_file_name, "r", encoding=ENCODING) as reminder_file:
-            file_data = json.load(reminder_file)
-        for reminder_json in file_data:
-            reminder = Reminder()
-            reminder.load_from_json(reminder_json)
-            user_id = str(reminder.get_user_id())
-            if user_id not in all_reminders:
-                all_reminders[user_id] = []
-            all_reminders.get(user_id).append(reminder)
-    return all_reminders
-
 def get_readable_time_from_timestamp(timestamp: float) -> str:
     return datetime.fromtimestamp(timestamp).replace(microsecond=0).strftime(DATE_FORMAT)
 
 class Reminder:
+    # Reminders are kept in memory for every user, so avoid a __dict__ per reminder
+    __slots__ = ("time_to_remind_timestamp", "message_timestamp", "user_id", "server_id", "channel_id",
+                 "message_text", "message_command", "message_id", "raw_message", "interval_amount",
+                 "interval_measure", "failed_count", "reminder_id")
 
     def __init__(self) -> None:
         self.time_to_remind_timestamp: float
         self.message_timestamp: float
-        self.user_to_mention: str
         self.user_id: int
         self.server_id: int
         self.channel_id: int
         self.message_text: str
         self.message_command: str
-        self.message_id: str
+        self.message_id: int
         self.raw_message: str
-        self.interval_amount: None | int
-        self.interval_measure: None | str
-        self.failed_count: None | int
-        self.interval_exists = False
+        self.interval_amount: None | int = None
+        self.interval_measure: None | str = None
+        self.failed_count: int = 0
+        self.reminder_id: None | int = None
 
     def load_from_json(self, reminder_json: dict) -> None:
         self.time_to_remind_timestamp = float(reminder_json.get("reminder_timestamp"))
         self.message_timestamp = float(reminder_json.get("now_timestamp"))
         self.user_id = int(reminder_json.get("user_id"))
-        self.user_to_mention = str(f"<@{self.user_id}>")
         self.server_id = int(reminder_json.get("server_id"))
         self.channel_id = int(reminder_json.get("channel_id"))
         self.message_text = str(reminder_json.get("message_text"))
-        self.message_command = str(reminder_json.get("message_commands"))
-        self.message_id = str(reminder_json.get("message_id"))
+        # Many reminders share the same command, e.g. '!reminder time 1 day'
+        self.message_command = sys.intern(str(reminder_json.get("message_commands")))
+        self.message_id = int(reminder_json.get("message_id"))
         self.raw_message = str(reminder_json.get("raw_message"))
         self.interval_amount = reminder_json.get("interval_amount")
         self.interval_measure = reminder_json.get("interval_measure")
         self.failed_count = reminder_json.get("failed_count")
+        self.reminder_id = reminder_json.get("reminder_id")
         self.set_additionals()
 
     def set_additionals(self) -> None:
-        self.interval_exists = False
-
-        if self.interval_measure is not None and self.interval_amount is not None:
-            self.interval_exists = True
+        if self.interval_amount is not None:
             self.interval_amount = int(self.interval_amount)
 
+        if self.interval_measure is not None:
+            self.interval_measure = sys.intern(str(self.interval_measure))
+
         if self.failed_count is None:
             self.failed_count = 0
         else:
             self.failed_count = int(self.failed_count)
 
+        if self.reminder_id is not None:
+            self.reminder_id = int(self.reminder_id)
+
     def get_interval_text(self) -> str:
         if not self.has_interval():
             return ""
         return f" (Interval: {self.interval_amount} {self.interval_measure})"
 
-    def get_as_text(self, index) -> str:
+    def get_as_text(self) -> str:
         link = HelperBotFunctions.craft_message_link(self.server_id, self.channel_id, self.message_id)
         readable_message_time = get_readable_time_from_timestamp(self.message_timestamp)
         readable_reminder_time = get_readable_time_from_timestamp(self.time_to_remind_timestamp)
-        message = f"> **{index} : {readable_message_time} -> {readable_reminder_time}{self.get_interval_text()}\n> {link}**" \
+        message = f"> **{self.reminder_id} : {readable_message_time} -> {readable_reminder_time}{self.get_interval_text()}\n> {link}**" \
                         f"\n{self.message_command}\n{self.message_text}\n"
         return message
     
     def get_user_id(self) -> int:
         return self.user_id
+
+    def get_message_id(self) -> int:
+        return self.message_id
+
+    def get_reminder_id(self) -> None | int:
+        return self.reminder_id
+
+    def set_reminder_id(self, reminder_id: int) -> None:
+        self.reminder_id = reminder_id
     
     def get_reminder_timestamp(self) -> float:
         return self.time_to_remind_timestamp
@@ -149,10 +199,10 @@ class Reminder:
         return self.channel_id
     
     def get_user_to_mention(self) -> str:
-        return self.user_to_mention
+        return f"<@{self.user_id}>"
     
     def has_interval(self) -> bool:
-        return self.interval_exists
+        return self.interval_amount is not None and self.interval_measure is not None
     
     def get_interval_amount(self) -> int:
         return self.interval_amount
@@ -166,16 +216,17 @@ class Reminder:
     def increase_failed_count(self) -> None:
         self.failed_count += 1
 
+    def reset_failed_count(self) -> None:
+        self.failed_count = 0
+
     def set_reminder_time(self, time_to_remind_timestamp: float):
         self.time_to_remind_timestamp = time_to_remind_timestamp
 
     def set_interval(self, interval_amount: int, interval_measure: str) -> None:
         self.interval_amount = interval_amount
-        self.interval_measure = interval_measure
-        self.interval_exists = True
+        self.interval_measure = sys.intern(interval_measure)
 
     def remove_interval(self) -> None:
-        self.interval_exists = False
         self.interval_amount = None
         self.interval_measure = None
 
@@ -186,21 +237,259 @@ class Reminder:
             save_object["interval_measure"] = self.interval_measure
         if self.failed_count > 0:
             save_object["failed_count"] = self.failed_count
+        if self.reminder_id is not None:
+            save_object["reminder_id"] = self.reminder_id
         return save_object
 
+
+class SortedReminders:
+    """
+    A user's reminders sorted by reminder time, can be looked up by reminder id
+    """
+
+    def __init__(self):
+        # (timestamp, reminder id) of each reminder, in the same order as __reminders
+        self.__keys = []
+        self.__reminders = []
+        # Key and reminder by reminder id
+        self.__by_id = {}
+        self.__next_id = 1
+
+    def __len__(self) -> int:
+        return len(self.__reminders)
+
+    def __iter__(self):
+        return iter(self.__reminders)
+
+    def __getitem__(self, index):
+        return self.__reminders[index]
+
+    def __contains__(self, reminder: Reminder) -> bool:
+        found = self.__by_id.get(reminder.get_reminder_id())
+        return found is not None and found[1] is reminder
+
+    def add(self, reminder: Reminder) -> None:
+        """
+        Adds a reminder, giving it the next free id if it doesn't have one
+        :param reminder: Reminder
+        :return: nothing
+        """
+        reminder_id = reminder.get_reminder_id()
+        if reminder_id is None or reminder_id in self.__by_id:
+            reminder_id = self.__next_id
+            reminder.set_reminder_id(reminder_id)
+        self.__next_id = max(self.__next_id, reminder_id + 1)
+        key = (reminder.get_reminder_timestamp(), reminder_id)
+        index = bisect.bisect_right(self.__keys, key)
+        self.__keys.insert(index, key)
+        self.__reminders.insert(index, reminder)
+        self.__by_id[reminder_id] = (key, reminder)
+
+    def remove(self, reminder: Reminder) -> None:
+        """
+        Removes a reminder
+        :param reminder: Reminder
+        :return: nothing
+        """
+        if reminder not in self:
+            raise ValueError("Reminder is not in the list")
+        key, _ = self.__by_id.pop(reminder.get_reminder_id())
+        index = bisect.bisect_left(self.__keys, key)
+        del self.__keys[index]
+        del self.__reminders[index]
+
+    def get(self, reminder_id: int) -> None | Reminder:
+        found = self.__by_id.get(reminder_id)
+        if found is None:
+            return None
+        return found[1]
+
+class DiscordReminderSender:
+    """
+    Sends reminders to their channel, or to the user if that fails
+    """
+
+    def __init__(self, client):
+        self.__client = client
+
+    async def send(self, reminder: Reminder, messages_to_send: list) -> None:
+        """
+        Sends a reminder
+        :param reminder: Reminder
+        :param messages_to_send: list, Texts of the reminder
+        :return: nothing, raises discord.errors.HTTPException if the reminder couldn't be sent
+        """
+        channel_id = reminder.get_channel_id()
+        user_to_mention = reminder.get_user_to_mention()
+        try:
+            channel = self.__client.get_channel(channel_id)
+            # Workers without a gateway connection have no cache
+            if channel is None:
+                channel = await self.__client.fetch_channel(channel_id)
+            await HelperBotFunctions.send_embed_messages(messages_to_send, channel, "Reminder", user_to_mention,
+                                                         priority=MESSAGE_PRIORITY_HIGH)
+        except (discord.errors.Forbidden, discord.errors.HTTPException):
+            print(f"Failed to send reminder to channel {channel_id}")
+            # Send to message author instead
+            user = await self.__client.fetch_user(reminder.get_user_id())
+            await HelperBotFunctions.send_embed_messages(messages_to_send, user, "Reminder", user_to_mention,
+                                                         priority=MESSAGE_PRIORITY_HIGH)
+
+
+class ReminderListView(discord.ui.View):
+    """
+    Buttons for moving between pages of a user's reminder list
+    """
+
+    def __init__(self, organizer, user_id: str):
+        super().__init__(timeout=REMINDER_LIST_TIMEOUT_SECONDS)
+        self.organizer = organizer
+        self.user_id = user_id
+        self.page = 0
+        self.message = None
+        self.update_buttons(organizer.get_reminder_page_count(user_id))
+
+    def update_buttons(self, page_count: int) -> None:
+        self.previous_page.disabled = self.page <= 0
+        self.next_page.disabled = self.page >= page_count - 1
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # Only the user whose reminders are listed can turn the pages
+        return str(interaction.user.id) == self.user_id
+
+    async def show_page(self, interaction: discord.Interaction, page: int) -> None:
+        page_count = self.organizer.get_reminder_page_count(self.user_id)
+        self.page = max(0, min(page, page_count - 1))
+        self.update_buttons(page_count)
+        embed = self.organizer.get_reminder_page_embed(self.user_id, self.page)
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        await self.show_page(interaction, self.page - 1)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        await self.show_page(interaction, self.page + 1)
+
+    async def on_timeout(self) -> None:
+        if self.message is None:
+            return
+        try:
+            await self.message.edit(view=None)
+        except (discord.errors.Forbidden, discord.errors.HTTPException):
+            pass
+
+
 class ReminderOrganizer:
 
-    def __init__(self, bot):
+    def __init__(self, bot, sender=None, shard_manager=None, run_scheduler=True):
+        """
+        :param bot: Bot, None for workers without Discord
+        :param sender: Sends due reminders, DiscordReminderSender by default
+        :param shard_manager: ShardLeaseManager, If given only reminders of the shards it owns are handled
+        :param run_scheduler: bool, If false reminders are only kept in sync with storage and sent by workers
+        """
         self.__bot = bot
-        self.__list_of_reminders = get_reminders()
+        self.__sender = sender
+        if sender is None:
+            self.__sender = DiscordReminderSender(bot)
+        self.__shard_manager = shard_manager
+        self.__run_scheduler = run_scheduler
+        if (shard_manager is not None or not run_scheduler) and REMINDER_STORAGE != "sqlite":
+            raise ValueError("Sharing reminders between processes needs REMINDER_STORAGE = \"sqlite\"")
+        # None means all shards
+        self.__owned_shards = None
+        # Keys of reminders changed in memory while syncing with storage
+        self.__changed_keys = None
+        # Number of the latest storage change that is in memory
+        self.__change_sequence = 0
+        self.__storage = HelperBotReminderStorage.get_reminder_storage()
+        # Filled by load_reminders
+        self.__list_of_reminders = {}
+        self.__load_task = None
+        self.__ready = asyncio.Event()
         self.__reminder_task_started = False
+        # Min-heap of [timestamp, counter, user_id, reminder], removed entries have reminder set to None
+        self.__reminder_queue = []
+        self.__queue_entries = {}
+        self.__queue_counter = itertools.count()
+        self.__queue_changed = asyncio.Event()
+        # Due reminders waiting to be sent, by channel id
+        self.__delivery_queues = {}
+        self.__delivery_tasks = set()
+        self.__delivery_semaphore = asyncio.Semaphore(REMINDER_SEND_CONCURRENCY)
+        # Rendered reminder list pages by user id
+        self.__page_cache = {}
+
+    def begin_loading(self):
+        """
+        Starts loading reminders in the background, so the bot can log in at the same time
+        :return: nothing
+        """
+        if self.__load_task is None:
+            self.__load_task = asyncio.create_task(self.load_reminders())
+
+    async def load_reminders(self):
+        """
+        Reads reminders from storage in a thread and builds the reminder lists and queue in small steps
+        :return: nothing
+        """
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        # Taken before loading, changes made meanwhile are synced again later
+        self.__change_sequence = await loop.run_in_executor(None, self.__storage.get_change_sequence)
+        save_objects = await loop.run_in_executor(None, self.__storage.load_reminders, self.__owned_shards)
+        read_done = time.perf_counter()
+        without_id = []
+        for index, reminder_json in enumerate(save_objects):
+            reminder = Reminder()
+            reminder.load_from_json(reminder_json)
+            user_id = str(reminder.get_user_id())
+            if user_id not in self.__list_of_reminders:
+                self.__list_of_reminders[user_id] = SortedReminders()
+            if reminder.get_reminder_id() is None:
+                without_id.append((user_id, reminder))
+            self.__list_of_reminders.get(user_id).add(reminder)
+            entry = [reminder.get_reminder_timestamp(), next(self.__queue_counter), user_id, reminder]
+            self.__queue_entries[id(reminder)] = entry
+            self.__reminder_queue.append(entry)
+            # Let the bot handle other events every now and then
+            if index % REMINDER_LOAD_BATCH_SIZE == 0:
+                await asyncio.sleep(0)
+        heapq.heapify(self.__reminder_queue)
+        # Save ids given to reminders made before reminders had ids
+        for user_id, reminder in without_id:
+            self.write_reminder_to_disk(user_id, reminder)
+        build_done = time.perf_counter()
+        print(f"Loaded {len(save_objects)} reminders of {len(self.__list_of_reminders)} users in "
+              f"{build_done - start:.3f} s (read {read_done - start:.3f} s, build {build_done - read_done:.3f} s)")
+        self.__ready.set()
+        self.__queue_changed.set()
+
+    def is_ready(self):
+        return self.__ready.is_set()
+
+    async def wait_until_ready(self):
+        await self.__ready.wait()
 
     async def start(self):
         # If it has already been started, return
         if self.__reminder_task_started:
             return
         self.__reminder_task_started = True
-        await self.reminder_function()
+        if self.__shard_manager is not None:
+            self.__owned_shards = await asyncio.get_running_loop().run_in_executor(None,
+                                                                                   self.__shard_manager.heartbeat)
+        self.begin_loading()
+        await self.wait_until_ready()
+        tasks = []
+        if self.__run_scheduler:
+            tasks.append(self.reminder_function())
+        # Reminders are shared with other processes
+        if self.__shard_manager is not None or not self.__run_scheduler:
+            tasks.append(self.shard_function())
+        await asyncio.gather(*tasks)
 
     def get_started(self):
         return self.__reminder_task_started
@@ -208,47 +497,73 @@ class ReminderOrganizer:
     def get_list_of_reminders(self):
         return self.__list_of_reminders
 
-    async def get_reminder_with_index(self, message, index):
+    def get_storage(self):
+        return self.__storage
+
+    def close(self):
+        """
+        Writes all pending reminder changes and closes the storage
+        :return: nothing
+        """
+        self.__storage.close()
+
+    async def get_reminder_with_id(self, message, reminder_id):
         """
         Gets reminder
         :param message: Message
-        :param index: int, Index of the reminder
+        :param reminder_id: int, Id of the reminder
         :return: Reminder, Reminder
         """
+        await self.wait_until_ready()
         user_id = str(message.author.id)
-        if user_id not in self.__list_of_reminders:
+        if user_id not in self.__list_of_reminders or len(self.__list_of_reminders.get(user_id)) < 1:
             await message.channel.send("You don't have any reminders!")
             return None
-        reminders = self.__list_of_reminders.get(user_id)
-        if len(reminders) <= index:
-            await message.channel.send("You don't have that many reminders!")
+        reminder = self.__list_of_reminders.get(user_id).get(reminder_id)
+        if reminder is None:
+            await message.channel.send("You don't have a reminder with that id!")
             return None
-        return reminders[index]
+        return reminder
 
-    def write_reminders_to_disk(self, user_id):
+    def write_reminder_to_disk(self, user_id, reminder):
         """
-        Writes a given users reminders to disk
+        Writes a given reminder to disk
         :param user_id: str
+        :param reminder: Reminder
+        :return: nothing
+        """
+        self.__storage.write_changes(user_id, {str(reminder.get_message_id()): reminder.to_save_object()}, [])
+        if self.__changed_keys is not None:
+            self.__changed_keys.add(str(reminder.get_message_id()))
+        # Every change to a reminder is written, so rendered pages are dropped here
+        self.__page_cache.pop(str(user_id), None)
+
+    def delete_reminder_from_disk(self, user_id, reminder):
+        """
+        Deletes a given reminder from disk
+        :param user_id: str
+        :param reminder: Reminder
         :return: nothing
         """
-        reminders = [reminder.to_save_object() for reminder in self.__list_of_reminders.get(user_id)]
-        with open(PATH_TO_REMINDERS + os.sep + f"{user_id}.json", "w", encoding=ENCODING) as reminder_file:
-            json.dump(reminders, reminder_file, indent=2, ensure_ascii=False)
+        self.__storage.write_changes(user_id, {}, [str(reminder.get_message_id())])
+        if self.__changed_keys is not None:
+            self.__changed_keys.add(str(reminder.get_message_id()))
+        self.__page_cache.pop(str(user_id), None)
 
     async def reminder_help(self, ctx, incorrect_format=""):
         message = ctx.message
         await HelperBotFunctions.send_messages([incorrect_format, REMINDER_HELP], message.channel,
                                                make_code_format=True)
 
-    async def delete(self, ctx, index: int):
+    async def delete(self, ctx, reminder_id: int):
         message = ctx.message
         user_id = str(message.author.id)
-        reminder = await self.get_reminder_with_index(message, index)
+        reminder = await self.get_reminder_with_id(message, reminder_id)
 
         if reminder is None:
             return
 
-        message_to_send = reminder.get_as_text(index)
+        message_to_send = reminder.get_as_text()
         try:
             # Get confirmation
             await HelperBotFunctions.send_embed_messages(
@@ -265,19 +580,65 @@ class ReminderOrganizer:
             await HelperBotFunctions.send_embed_messages([message_to_send], message.channel, "Deleted"
                                                          , content=f"<@{user_id}>")
 
+    def render_reminder_pages(self, user_id: str) -> list:
+        """
+        Renders a user's reminder list into pages of at most REMINDER_LIST_PAGE_SIZE reminders that fit in an embed, a
+        reminder too long for one page continues on the next ones. Pages are cached until the user's reminders change
+        :param user_id: str
+        :return: list, Texts of the pages
+        """
+        if user_id in self.__page_cache:
+            return self.__page_cache.get(user_id)
+        pages = []
+        current_pieces = []
+        current_length = 0
+        for reminder in self.__list_of_reminders.get(user_id, []):
+            # Reminders are separated by an empty line
+            text = reminder.get_as_text() + "\n"
+            if len(current_pieces) >= REMINDER_LIST_PAGE_SIZE or \
+                    (current_length + len(text) > EMBED_MESSAGE_MAX_CHARACTERS and current_length > 0):
+                pages.append("".join(current_pieces))
+                current_pieces = []
+                current_length = 0
+            parts = HelperBotFunctions.craft_correct_length_messages([text], embed_message=True)
+            pages.extend(parts[:-1])
+            current_pieces.append(parts[-1])
+            current_length += len(parts[-1])
+        if len(current_pieces) > 0 or len(pages) < 1:
+            pages.append("".join(current_pieces))
+        self.__page_cache[user_id] = pages
+        return pages
+
+    def get_reminder_page_count(self, user_id: str) -> int:
+        return len(self.render_reminder_pages(user_id))
+
+    def render_reminder_page(self, user_id: str, page: int) -> str:
+        """
+        :param user_id: str
+        :param page: int, Page number starting from 0
+        :return: str, Text of the page
+        """
+        return self.render_reminder_pages(user_id)[page]
+
+    def get_reminder_page_embed(self, user_id: str, page: int) -> discord.Embed:
+        title = f"List of reminders ({page + 1}/{self.get_reminder_page_count(user_id)})"
+        return discord.Embed(title=title, description=self.render_reminder_page(user_id, page),
+                             colour=discord.Colour.from_rgb(255, 255, 255))
+
     async def list_reminders(self, ctx):
+        await self.wait_until_ready()
         message = ctx.message
         author_id = str(message.author.id)
-        messages_to_send = []
-        if author_id not in self.__list_of_reminders:
+        if author_id not in self.__list_of_reminders or len(self.__list_of_reminders.get(author_id)) < 1:
             await message.channel.send("You don't have any reminders")
             return
-        for index, reminder in enumerate(self.__list_of_reminders.get(author_id)):
-            current_message = f"{reminder.get_as_text(index)}\n"
-            messages_to_send.append(current_message)
-        title = "List of reminders"
         content = f"<@{author_id}>"
-        await HelperBotFunctions.send_embed_messages(messages_to_send, message.channel, title, content)
+        embed = self.get_reminder_page_embed(author_id, 0)
+        if self.get_reminder_page_count(author_id) < 2:
+            await message.channel.send(content=content, embed=embed)
+            return
+        view = ReminderListView(self, author_id)
+        view.message = await message.channel.send(content=content, embed=embed, view=view)
 
     async def date(self, ctx, reminder_date: str, reminder_time: str, message_text: str = "", *args):
         reminder_timestamp = get_valid_date(reminder_date, reminder_time)
@@ -319,10 +680,9 @@ class ReminderOrganizer:
                                               f" minutes)")
 
         reminder.set_interval(interval, time_measure)
-        self.write_reminders_to_disk(user_id)
+        self.write_reminder_to_disk(user_id, reminder)
         if announce:
-            index = self.get_reminder_index(user_id, reminder)
-            messages_to_send = reminder.get_as_text(index)
+            messages_to_send = reminder.get_as_text()
             title = "Interval added"
             content = f"<@{user_id}>"
             await HelperBotFunctions.send_embed_messages(messages_to_send, message.channel, title, content)
@@ -336,9 +696,8 @@ class ReminderOrganizer:
             return await HelperBotFunctions.send_messages(["There's no interval set to given reminder"], message.channel)
 
         reminder.remove_interval()
-        self.write_reminders_to_disk(user_id)
-        index = self.get_reminder_index(user_id, reminder)
-        messages_to_send = reminder.get_as_text(index)
+        self.write_reminder_to_disk(user_id, reminder)
+        messages_to_send = reminder.get_as_text()
         title = "Interval removed"
         content = f"<@{user_id}>"
         await HelperBotFunctions.send_embed_messages(messages_to_send, message.channel, title, content)
@@ -353,9 +712,10 @@ class ReminderOrganizer:
         :param announce: bool, If true will send a message to announce adding interval
         :return: dict, Reminder
         """
+        await self.wait_until_ready()
         user_id = str(message.author.id)
         if user_id not in self.__list_of_reminders:
-            self.__list_of_reminders[user_id] = {}
+            self.__list_of_reminders[user_id] = SortedReminders()
         # Check that user doesn't have too many reminder already
         elif len(self.__list_of_reminders.get(user_id)) > MAXIMUM_REMINDERS:
             return await message.channel.send("There are already too many reminders")
@@ -378,85 +738,320 @@ class ReminderOrganizer:
         self.add_reminder(user_id, reminder)
 
         if announce:
-            index = self.get_reminder_index(user_id, reminder)
-            messages_to_send = [reminder.get_as_text(index)]
+            messages_to_send = [reminder.get_as_text()]
             title = "Reminder added"
             content = f"<@{user_id}>"
             await HelperBotFunctions.send_embed_messages(messages_to_send, message.channel, title, content)
         return reminder
     
     def add_reminder(self, user_id: str, reminder: Reminder):
-        user_reminders = self.__list_of_reminders.get(str(user_id))
-        user_reminders.append(reminder)
-        self.__list_of_reminders[str(user_id)] = sorted(user_reminders, key=lambda x: x.get_reminder_timestamp())
-        self.write_reminders_to_disk(user_id)
+        self.__list_of_reminders.get(str(user_id)).add(reminder)
+        self.write_reminder_to_disk(user_id, reminder)
+        self.schedule_reminder(user_id, reminder)
 
     def remove_reminder(self, user_id: str, reminder: Reminder):
-        index = self.get_reminder_index(user_id, reminder)
-        self.__list_of_reminders.get(str(user_id)).pop(index)
-        self.write_reminders_to_disk(user_id)
+        self.__list_of_reminders.get(str(user_id)).remove(reminder)
+        self.delete_reminder_from_disk(user_id, reminder)
+        self.unschedule_reminder(reminder)
+
+    def schedule_reminder(self, user_id: str, reminder: Reminder, timestamp: float = None):
+        """
+        Adds a reminder to the due-time queue, replacing its earlier entry
+        :param user_id: str
+        :param reminder: Reminder
+        :param timestamp: float, When to handle the reminder, reminder's own timestamp by default
+        :return: nothing
+        """
+        self.unschedule_reminder(reminder)
+        if timestamp is None:
+            timestamp = reminder.get_reminder_timestamp()
+        entry = [timestamp, next(self.__queue_counter), str(user_id), reminder]
+        self.__queue_entries[id(reminder)] = entry
+        heapq.heappush(self.__reminder_queue, entry)
+        # Wake up the scheduler if this is now the next reminder due
+        if self.__reminder_queue[0] is entry:
+            self.__queue_changed.set()
+
+    def unschedule_reminder(self, reminder: Reminder):
+        """
+        Marks a reminder's queue entry as removed
+        :param reminder: Reminder
+        :return: nothing
+        """
+        entry = self.__queue_entries.pop(id(reminder), None)
+        if entry is None:
+            return
+        entry[-1] = None
+        if self.__reminder_queue[0] is entry:
+            self.__queue_changed.set()
+        # Rebuild the queue if it's mostly removed entries
+        if len(self.__reminder_queue) > 2 * len(self.__queue_entries) + 64:
+            self.__reminder_queue = [entry for entry in self.__reminder_queue if entry[-1] is not None]
+            heapq.heapify(self.__reminder_queue)
+
+    async def send_reminder(self, user_id: str, reminder: Reminder):
+        """
+        Sends a due reminder and reschedules it if it has an interval
+        :param user_id: str
+        :param reminder: Reminder
+        :return: nothing
+        """
+        # Reminder might have been removed while earlier reminders were being sent
+        user_reminders = self.__list_of_reminders.get(user_id)
+        if user_reminders is None or reminder not in user_reminders or not self.owns_user(user_id):
+            return
+        message_to_send = reminder.get_as_text()
+        failed_count = reminder.get_failed_count()
+        next_occurrence = None
+        if reminder.has_interval():
+            next_occurrence = get_next_occurrence(reminder.get_reminder_timestamp(), reminder.get_interval_amount(),
+                                                  reminder.get_interval_measure())
+        messages_to_send = [message_to_send]
+        times_to_send = 1
+        # Interval occurrences that were missed, e.g. while the bot was offline
+        if next_occurrence is not None and next_occurrence[1] > 0:
+            missed = next_occurrence[1]
+            if INTERVAL_CATCH_UP_POLICY == "coalesce":
+                messages_to_send = [f"{message_to_send}*(Also missed {missed} earlier time(s))*\n"]
+            elif INTERVAL_CATCH_UP_POLICY == "replay":
+                times_to_send = min(missed + 1, INTERVAL_REPLAY_LIMIT)
+        sent_count = 0
+        try:
+            # Each replayed occurrence is sent as its own message
+            for _ in range(times_to_send):
+                await self.__sender.send(reminder, messages_to_send)
+                sent_count += 1
+        # Fail and try again a bit later
+        except (discord.errors.Forbidden, discord.errors.HTTPException):
+            # Only skip deleting reminder if the maximum fail count is not reached, and nothing was sent yet so that
+            # replayed occurrences aren't sent twice
+            if sent_count == 0 and failed_count <= MAXIMUM_FAILED_COUNT:
+                reminder.increase_failed_count()
+                self.write_reminder_to_disk(user_id, reminder)
+                self.schedule_reminder(user_id, reminder, datetime.now().timestamp() + get_retry_delay(failed_count))
+                return
+
+        # Remove reminder
+        self.remove_reminder(user_id, reminder)
+        # If reminder has interval make a new one at the next occurrence
+        if next_occurrence is not None:
+            # Failures before this delivery shouldn't shorten the retries of later occurrences
+            if sent_count > 0:
+                reminder.reset_failed_count()
+            reminder.set_reminder_time(next_occurrence[0])
+            self.add_reminder(user_id, reminder)
+
+    def release_shards(self):
+        """
+        Stops sending reminders of every shard, used when shutting down before the shards are given away
+        :return: nothing
+        """
+        self.__owned_shards = set()
+
+    def owns_user(self, user_id: str) -> bool:
+        return self.__owned_shards is None or get_shard(user_id) in self.__owned_shards
+
+    def forget_reminder(self, user_id: str, reminder: Reminder):
+        """
+        Removes a reminder from memory only, used when it was removed by another process or its shard was given away
+        :param user_id: str
+        :param reminder: Reminder
+        :return: nothing
+        """
+        self.__list_of_reminders.get(user_id).remove(reminder)
+        self.unschedule_reminder(reminder)
+        self.__page_cache.pop(user_id, None)
 
-    def get_reminder_index(self, user_id: str, reminder: Reminder) -> int:
-        return self.__list_of_reminders.get(user_id).index(reminder)
+    def remember_reminder(self, user_id: str, reminder: Reminder):
+        """
+        Adds a reminder to memory only, used when it was added by another process or its shard was taken over
+        :param user_id: str
+        :param reminder: Reminder
+        :return: nothing
+        """
+        if user_id not in self.__list_of_reminders:
+            self.__list_of_reminders[user_id] = SortedReminders()
+        self.__list_of_reminders.get(user_id).add(reminder)
+        self.schedule_reminder(user_id, reminder)
+        self.__page_cache.pop(user_id, None)
+
+    def apply_stored_reminder(self, user_id: str, key: str, save_object):
+        """
+        Brings a reminder in memory up to date with how it is stored
+        :param user_id: str
+        :param key: str, Reminder key
+        :param save_object: dict, Stored reminder, None if it was removed
+        :return: nothing
+        """
+        old_reminder = None
+        for reminder in self.__list_of_reminders.get(user_id, []):
+            if str(reminder.get_message_id()) == key:
+                old_reminder = reminder
+                break
+        if old_reminder is not None:
+            if save_object is not None and old_reminder.to_save_object() == save_object:
+                return
+            self.forget_reminder(user_id, old_reminder)
+        if save_object is None:
+            return
+        reminder = Reminder()
+        reminder.load_from_json(save_object)
+        self.remember_reminder(user_id, reminder)
+
+    async def sync_reminders(self):
+        """
+        Brings all reminders in memory up to date with storage, only reminders of owned shards are kept
+        :return: nothing
+        """
+        await self.__storage.flush()
+        loop = asyncio.get_running_loop()
+        # Reminders changed while storage is being read are newer in memory
+        self.__changed_keys = set()
+        try:
+            change_sequence = await loop.run_in_executor(None, self.__storage.get_change_sequence)
+            save_objects = await loop.run_in_executor(None, self.__storage.load_reminders, self.__owned_shards)
+            stored = {HelperBotReminderStorage.get_reminder_key(save_object): save_object
+                      for save_object in save_objects}
+            for user_id, user_reminders in list(self.__list_of_reminders.items()):
+                for reminder in list(user_reminders):
+                    key = str(reminder.get_message_id())
+                    if key not in self.__changed_keys and (key not in stored or not self.owns_user(user_id)):
+                        self.forget_reminder(user_id, reminder)
+            for key, save_object in stored.items():
+                if key not in self.__changed_keys:
+                    self.apply_stored_reminder(str(save_object.get("user_id")), key, save_object)
+            self.__change_sequence = change_sequence
+        finally:
+            self.__changed_keys = None
+
+    async def sync_changes(self):
+        """
+        Brings reminders in memory up to date with the reminders changed in storage since the last sync
+        :return: nothing
+        """
+        await self.__storage.flush()
+        self.__changed_keys = set()
+        try:
+            changes = await asyncio.get_running_loop().run_in_executor(None, self.__storage.load_changes,
+                                                                       self.__change_sequence, self.__owned_shards)
+            if changes is not None:
+                change_sequence, changed_reminders = changes
+                for key, user_id, save_object in changed_reminders:
+                    if key not in self.__changed_keys:
+                        self.apply_stored_reminder(user_id, key, save_object)
+                self.__change_sequence = change_sequence
+        finally:
+            self.__changed_keys = None
+        # Too far behind for the change log
+        if changes is None:
+            await self.sync_reminders()
+
+    async def change_shards(self, owned_shards: set):
+        """
+        Forgets reminders of shards given away and loads the reminders of shards taken over
+        :param owned_shards: set
+        :return: nothing
+        """
+        print(f"Now handling reminder shards {sorted(owned_shards)}")
+        previous_shards = self.__owned_shards
+        self.__owned_shards = owned_shards
+        # Changes of given away shards are written before another worker takes them over
+        await self.__storage.flush()
+        for user_id, user_reminders in list(self.__list_of_reminders.items()):
+            if not self.owns_user(user_id):
+                for reminder in list(user_reminders):
+                    self.forget_reminder(user_id, reminder)
+        if previous_shards is None:
+            return
+        new_shards = owned_shards - previous_shards
+        if len(new_shards) < 1:
+            return
+        # Changes of the new shards are already in what is loaded
+        save_objects = await asyncio.get_running_loop().run_in_executor(None, self.__storage.load_reminders,
+                                                                        new_shards)
+        for save_object in save_objects:
+            user_id = str(save_object.get("user_id"))
+            if self.owns_user(user_id):
+                self.apply_stored_reminder(user_id, HelperBotReminderStorage.get_reminder_key(save_object),
+                                           save_object)
+
+    async def shard_function(self):
+        """
+        Renews shard leases and syncs reminders changed in storage by other processes
+        :return: nothing
+        """
+        loop = asyncio.get_running_loop()
+        heartbeat_seconds = REMINDER_SHARD_HEARTBEAT_SECONDS
+        if self.__shard_manager is not None:
+            heartbeat_seconds = self.__shard_manager.get_heartbeat_seconds()
+        while True:
+            await asyncio.sleep(heartbeat_seconds)
+            if self.__shard_manager is not None:
+                owned_shards = await loop.run_in_executor(None, self.__shard_manager.heartbeat)
+                if owned_shards != self.__owned_shards:
+                    await self.change_shards(owned_shards)
+            await self.sync_changes()
 
     async def reminder_function(self):
         """
-        Checks reminders every 10 seconds and send reminders
+        Sleeps until the next reminder is due and sends it, wakes up early if the next reminder changes
         :return: nothing
         """
         while True:
+            self.__queue_changed.clear()
+            # Drop removed reminders from the top of the queue
+            while len(self.__reminder_queue) > 0 and self.__reminder_queue[0][-1] is None:
+                heapq.heappop(self.__reminder_queue)
+            # If reminder queue is empty, wait until something is added
+            if len(self.__reminder_queue) < 1:
+                await self.__queue_changed.wait()
+                continue
             now = datetime.now().timestamp()
-            # If reminder list is empty
-            if len(self.__list_of_reminders) < 1:
-                await asyncio.sleep(10)
+            delay = self.__reminder_queue[0][0] - now
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.__queue_changed.wait(),
+                                           timeout=min(delay, REMINDER_MAX_SLEEP_SECONDS))
+                except asyncio.TimeoutError:
+                    pass
                 continue
-            for user_id in self.__list_of_reminders:
-                to_be_handled = []
-                user_reminders = self.__list_of_reminders.get(user_id)
-                # If user has no reminders, go to next user
-                if len(user_reminders) < 1:
+            while len(self.__reminder_queue) > 0 and self.__reminder_queue[0][0] <= now:
+                _, _, user_id, reminder = heapq.heappop(self.__reminder_queue)
+                if reminder is None:
                     continue
-                for reminder in user_reminders:
-                    if now >= reminder.get_reminder_timestamp():
-                        to_be_handled.append(reminder)
-
-                for reminder in to_be_handled:
-                    server_id = reminder.get_server_id()
-                    channel_id = reminder.get_channel_id()
-                    user_to_mention = reminder.get_user_to_mention()
-                    channel = self.__bot.get_guild(server_id).get_channel(channel_id)
-                    index = self.get_reminder_index(user_id, reminder)
-                    message_to_send = reminder.get_as_text(index)
-                    failed_count = reminder.get_failed_count()
+                del self.__queue_entries[id(reminder)]
+                self.queue_delivery(user_id, reminder)
+
+    def queue_delivery(self, user_id: str, reminder: Reminder):
+        """
+        Queues a due reminder to be sent by its channel's delivery task
+        :param user_id: str
+        :param reminder: Reminder
+        :return: nothing
+        """
+        channel_id = reminder.get_channel_id()
+        if channel_id in self.__delivery_queues:
+            self.__delivery_queues.get(channel_id).append((user_id, reminder))
+            return
+        self.__delivery_queues[channel_id] = deque([(user_id, reminder)])
+        task = asyncio.create_task(self.deliver_channel(channel_id))
+        self.__delivery_tasks.add(task)
+        task.add_done_callback(self.__delivery_tasks.discard)
+
+    async def deliver_channel(self, channel_id: int):
+        """
+        Sends a channel's due reminders in order, at most REMINDER_SEND_CONCURRENCY are sent at once over all channels
+        :param channel_id: int
+        :return: nothing
+        """
+        delivery_queue = self.__delivery_queues.get(channel_id)
+        try:
+            while len(delivery_queue) > 0:
+                user_id, reminder = delivery_queue.popleft()
+                async with self.__delivery_semaphore:
                     try:
-                        await HelperBotFunctions.send_embed_messages([message_to_send], channel,
-                                                                    "Reminder", user_to_mention)
-                    except (discord.errors.Forbidden, discord.errors.HTTPException):
-                        print(f"Failed to send reminder to channel {channel_id}")
-                        # Send to message author instead
-                        try:
-                            user = await self.__bot.fetch_user(user_id)
-                            await HelperBotFunctions.send_embed_messages([message_to_send], user,
-                                                                    "Reminder", user_to_mention)
-                        # Fail and try again the next time
-                        except (discord.errors.Forbidden, discord.errors.HTTPException):
-                            # Only skip deleting reminder if the maximum fail count is not reached (TODO)
-                            if failed_count <= MAXIMUM_FAILED_COUNT:
-                                continue
-                            reminder.increase_failed_count()
-
-                    # Remove reminder
-                    self.remove_reminder(user_id, reminder)
-                    # If reminder has interval make a new one after the interval
-                    if reminder.has_interval():
-                        interval_amount = reminder.get_interval_amount()
-                        interval_measure = reminder.get_interval_measure()
-                        time_to_remind_timestamp = reminder.get_reminder_timestamp()
-                        new_timestamp = get_date_with_delta(interval_amount, interval_measure,
-                                                            datetime.fromtimestamp(time_to_remind_timestamp))
-                        if new_timestamp is not None:
-                            reminder.set_reminder_time(new_timestamp)
-                            self.add_reminder(user_id, reminder)
-
-            # Sleep for 10 seconds after checking each user
-            await asyncio.sleep(10)
+                        await self.send_reminder(user_id, reminder)
+                    except Exception as error:
+                        print(f"Failed to handle reminder for user {user_id}: {error}")
+        finally:
+            del self.__delivery_queues[channel_id]
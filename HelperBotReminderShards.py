@@ -0,0 +1,98 @@
+import math
+import sqlite3
+import time
+from HelperBotConstants import *
+
+
+def get_shard(user_id, shard_count=REMINDER_SHARD_COUNT) -> int:
+    """
+    Gets the shard a user's reminders belong to
+    :param user_id: str/int
+    :param shard_count: int
+    :return: int, Shard number
+    """
+    return int(user_id) % shard_count
+
+
+class ShardLeaseManager:
+    """
+    Shares reminder shards between scheduler workers with leases kept in SQLite. Each worker takes an even share of
+    the shards and renews its leases with heartbeat(), shards of workers that stop renewing are taken over by others
+    """
+
+    def __init__(self, worker_id: str, path=PATH_TO_REMINDER_SHARD_DATABASE, shard_count=REMINDER_SHARD_COUNT,
+                 lease_seconds=REMINDER_SHARD_LEASE_SECONDS, heartbeat_seconds=REMINDER_SHARD_HEARTBEAT_SECONDS):
+        self.__worker_id = worker_id
+        self.__shard_count = shard_count
+        self.__lease_seconds = lease_seconds
+        self.__heartbeat_seconds = heartbeat_seconds
+        # Transactions are handled manually so a heartbeat can lock the database for its whole duration
+        self.__connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.__connection.execute("CREATE TABLE IF NOT EXISTS shard_workers (worker_id TEXT PRIMARY KEY, "
+                                  "last_seen REAL NOT NULL)")
+        self.__connection.execute("CREATE TABLE IF NOT EXISTS shard_leases (shard INTEGER PRIMARY KEY, owner TEXT, "
+                                  "expires REAL NOT NULL)")
+
+    def get_worker_id(self) -> str:
+        return self.__worker_id
+
+    def get_heartbeat_seconds(self) -> float:
+        """
+        :return: float, How often heartbeat() should be called
+        """
+        return self.__heartbeat_seconds
+
+    def heartbeat(self) -> set:
+        """
+        Renews this worker's leases, gives away shards over its share and claims free shards up to its share
+        :return: set, Shards owned by this worker
+        """
+        now = time.time()
+        connection = self.__connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("INSERT OR REPLACE INTO shard_workers (worker_id, last_seen) VALUES (?, ?)",
+                               (self.__worker_id, now))
+            connection.execute("DELETE FROM shard_workers WHERE last_seen < ?", (now - self.__lease_seconds,))
+            alive_workers = {worker_id for worker_id, in connection.execute("SELECT worker_id FROM shard_workers")}
+            fair_share = math.ceil(self.__shard_count / len(alive_workers))
+            leases = {shard: (owner, expires) for shard, owner, expires in
+                      connection.execute("SELECT shard, owner, expires FROM shard_leases")}
+            owned = sorted(shard for shard, (owner, _) in leases.items() if owner == self.__worker_id)
+            # Give away shards over the fair share, they can be claimed once the grace period is over so that this
+            # worker has time to stop sending their reminders
+            for shard in owned[fair_share:]:
+                connection.execute("UPDATE shard_leases SET owner = NULL, expires = ? WHERE shard = ?",
+                                   (now + self.__heartbeat_seconds, shard))
+            owned = set(owned[:fair_share])
+            for shard in range(self.__shard_count):
+                if len(owned) >= fair_share:
+                    break
+                if shard in owned:
+                    continue
+                owner, expires = leases.get(shard, (None, 0))
+                # Lease is held by a live worker or is in its grace period
+                if expires >= now and (owner is None or owner in alive_workers):
+                    continue
+                owned.add(shard)
+            connection.executemany("INSERT OR REPLACE INTO shard_leases (shard, owner, expires) VALUES (?, ?, ?)",
+                                   [(shard, self.__worker_id, now + self.__lease_seconds) for shard in owned])
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return owned
+
+    def release_all(self) -> None:
+        """
+        Gives away all shards of this worker right away, used when shutting down
+        :return: nothing
+        """
+        connection = self.__connection
+        connection.execute("BEGIN IMMEDIATE")
+        connection.execute("DELETE FROM shard_leases WHERE owner = ?", (self.__worker_id,))
+        connection.execute("DELETE FROM shard_workers WHERE worker_id = ?", (self.__worker_id,))
+        connection.execute("COMMIT")
+
+    def close(self) -> None:
+        self.__connection.close()
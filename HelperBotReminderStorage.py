@@ -0,0 +1,343 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import sqlite3
+import threading
+import time
+from HelperBotConstants import *
+from HelperBotReminderShards import get_shard
+
+
+def get_reminder_key(save_object: dict) -> str:
+    """
+    Gets the key a reminder is stored with
+    :param save_object: dict, Reminder's save object
+    :return: str, Key
+    """
+    return str(save_object.get("message_id"))
+
+
+def read_json_file(file_path: str):
+    with open(file_path, "r", encoding=ENCODING) as file:
+        return json.load(file)
+
+
+class JsonReminderStorage:
+    """
+    Stores each user's reminders in their own json file
+    """
+
+    def __init__(self, path=PATH_TO_REMINDERS):
+        self.__path = path
+        # Save objects by user id and reminder key
+        self.__reminders = {}
+
+    def load_reminders(self, shards=None) -> list:
+        """
+        Loads all reminders from disk, reading several files at once
+        :param shards: set, Only load reminders of users in these shards, all by default
+        :return: list, Save objects of the reminders
+        """
+        all_reminders = []
+        if not os.path.exists(self.__path):
+            return all_reminders
+        file_paths = [entry.path for entry in os.scandir(self.__path) if entry.name.endswith(".json")
+                      and (shards is None or get_shard(entry.name[:-len(".json")]) in shards)]
+        with ThreadPoolExecutor(max_workers=REMINDER_LOAD_THREADS) as executor:
+            for file_data in executor.map(read_json_file, file_paths):
+                for save_object in file_data:
+                    user_id = str(save_object.get("user_id"))
+                    if user_id not in self.__reminders:
+                        self.__reminders[user_id] = {}
+                    self.__reminders.get(user_id)[get_reminder_key(save_object)] = save_object
+                    all_reminders.append(save_object)
+        return all_reminders
+
+    def write_changes(self, user_id: str, upserts: dict, deletes) -> None:
+        """
+        Writes changed reminders of a user to disk
+        :param user_id: str
+        :param upserts: dict, Save objects by reminder key
+        :param deletes: iterable, Keys of removed reminders
+        :return: nothing
+        """
+        user_id = str(user_id)
+        if user_id not in self.__reminders:
+            self.__reminders[user_id] = {}
+        user_reminders = self.__reminders.get(user_id)
+        for key in deletes:
+            user_reminders.pop(key, None)
+        user_reminders.update(upserts)
+        reminders = sorted(user_reminders.values(), key=lambda x: float(x.get("reminder_timestamp")))
+        file_path = self.__path + os.sep + f"{user_id}.json"
+        # Write to a temporary file first so a crash can't leave a truncated file behind
+        with open(file_path + ".tmp", "w", encoding=ENCODING) as reminder_file:
+            json.dump(reminders, reminder_file, indent=2, ensure_ascii=False)
+        os.replace(file_path + ".tmp", file_path)
+
+    def get_change_sequence(self) -> int:
+        """
+        :return: int, Number of the latest change, json files aren't shared so there are none
+        """
+        return 0
+
+    def load_changes(self, after: int, shards=None):
+        return after, []
+
+    async def flush(self) -> None:
+        return
+
+    def close(self) -> None:
+        return
+
+
+class SqliteReminderStorage:
+    """
+    Stores all reminders in one SQLite database, one row per reminder
+    """
+
+    def __init__(self, path=PATH_TO_REMINDER_DATABASE):
+        # The connection is used from executor threads, one at a time
+        self.__connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.__lock = threading.Lock()
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("PRAGMA synchronous=NORMAL")
+        with self.__connection:
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS reminders (reminder_key TEXT PRIMARY KEY, "
+                                      "user_id TEXT NOT NULL, reminder_timestamp REAL NOT NULL, data TEXT NOT NULL)")
+            self.__connection.execute("CREATE INDEX IF NOT EXISTS reminders_user_id ON reminders (user_id)")
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            # Latest changed reminder keys, so other processes only need to read what changed since they last looked
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS reminder_changes (sequence INTEGER PRIMARY KEY "
+                                      "AUTOINCREMENT, reminder_key TEXT NOT NULL, user_id TEXT NOT NULL)")
+
+    def load_reminders(self, shards=None) -> list:
+        """
+        Loads all reminders from the database
+        :param shards: set, Only load reminders of users in these shards, all by default
+        :return: list, Save objects of the reminders
+        """
+        with self.__lock:
+            if shards is None:
+                rows = self.__connection.execute("SELECT data FROM reminders ORDER BY user_id, reminder_timestamp")
+            else:
+                rows = self.__connection.execute(
+                    f"SELECT data FROM reminders WHERE CAST(user_id AS INTEGER) % ? IN "
+                    f"({', '.join('?' * len(shards))}) ORDER BY user_id, reminder_timestamp",
+                    (REMINDER_SHARD_COUNT, *shards))
+            return [json.loads(data) for data, in rows]
+
+    def write_changes(self, user_id: str, upserts: dict, deletes) -> None:
+        """
+        Writes changed reminders of a user to the database in one transaction
+        :param user_id: str
+        :param upserts: dict, Save objects by reminder key
+        :param deletes: iterable, Keys of removed reminders
+        :return: nothing
+        """
+        with self.__lock, self.__connection:
+            self.__execute_changes(user_id, upserts, deletes)
+
+    def __execute_changes(self, user_id: str, upserts: dict, deletes) -> None:
+        """
+        Executes the statements of write_changes without committing them
+        """
+        self.__connection.executemany("DELETE FROM reminders WHERE reminder_key = ?", [(key,) for key in deletes])
+        self.__connection.executemany(
+            "INSERT OR REPLACE INTO reminders (reminder_key, user_id, reminder_timestamp, data) VALUES (?, ?, ?, ?)",
+            [(key, str(user_id), float(save_object.get("reminder_timestamp")),
+              json.dumps(save_object, ensure_ascii=False)) for key, save_object in upserts.items()])
+        self.__connection.executemany("INSERT INTO reminder_changes (reminder_key, user_id) VALUES (?, ?)",
+                                      [(key, str(user_id)) for key in [*deletes, *upserts]])
+        latest, = self.__connection.execute("SELECT COALESCE(MAX(sequence), 0) FROM reminder_changes").fetchone()
+        self.__connection.execute("DELETE FROM reminder_changes WHERE sequence <= ?",
+                                  (latest - REMINDER_CHANGE_LOG_SIZE,))
+
+    def migrate_from_json(self, path=PATH_TO_REMINDERS) -> int:
+        """
+        Copies reminders from per-user json files to the database, only done once
+        :param path: str, Path to the json files
+        :return: int, Amount of reminders migrated
+        """
+        if self.__connection.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone() is not None:
+            return 0
+        reminders_by_user = {}
+        for save_object in JsonReminderStorage(path).load_reminders():
+            user_id = str(save_object.get("user_id"))
+            if user_id not in reminders_by_user:
+                reminders_by_user[user_id] = {}
+            reminders_by_user.get(user_id)[get_reminder_key(save_object)] = save_object
+        with self.__lock:
+            # Workers starting at the same time could all get past the first check, this one holds the write lock
+            self.__connection.execute("BEGIN IMMEDIATE")
+            with self.__connection:
+                if self.__connection.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone():
+                    return 0
+                migrated = 0
+                for user_id, upserts in reminders_by_user.items():
+                    self.__execute_changes(user_id, upserts, [])
+                    migrated += len(upserts)
+                self.__connection.execute("INSERT INTO meta (key, value) VALUES ('migrated_from_json', ?)",
+                                          (str(migrated),))
+            return migrated
+
+    def get_change_sequence(self) -> int:
+        """
+        :return: int, Number of the latest change, load_changes gives the changes after it
+        """
+        with self.__lock:
+            return self.__connection.execute("SELECT COALESCE(MAX(sequence), 0) FROM reminder_changes").fetchone()[0]
+
+    def load_changes(self, after: int, shards=None):
+        """
+        Loads the reminders changed after a change number, by any process
+        :param after: int, Change number from get_change_sequence or an earlier load_changes
+        :param shards: set, Only give reminders of users in these shards, all by default
+        :return: tuple, Number of the latest change and a list of (reminder key, user id, save object or None if it
+        was removed), None if the changes aren't in the log anymore and everything has to be loaded again
+        """
+        with self.__lock:
+            oldest, = self.__connection.execute("SELECT MIN(sequence) FROM reminder_changes").fetchone()
+            if oldest is not None and oldest > after + 1:
+                return None
+            rows = self.__connection.execute(
+                "SELECT changes.sequence, changes.reminder_key, changes.user_id, reminders.data FROM reminder_changes "
+                "AS changes LEFT JOIN reminders ON reminders.reminder_key = changes.reminder_key "
+                "WHERE changes.sequence > ? ORDER BY changes.sequence", (after,)).fetchall()
+        latest = after
+        # A reminder changed many times is given once, as it is now
+        changes = {}
+        for sequence, key, user_id, data in rows:
+            latest = sequence
+            if shards is not None and get_shard(user_id) not in shards:
+                continue
+            changes.pop(key, None)
+            changes[key] = (user_id, data)
+        return latest, [(key, user_id, None if data is None else json.loads(data))
+                        for key, (user_id, data) in changes.items()]
+
+    async def flush(self) -> None:
+        return
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__connection.close()
+
+
+class WriteBehindReminderStorage:
+    """
+    Collects reminder changes for a short while and writes them with the given storage in a thread executor
+    """
+
+    def __init__(self, storage, delay=REMINDER_WRITE_DELAY_SECONDS):
+        self.__storage = storage
+        self.__delay = delay
+        # Pending (upserts, deletes) by user id
+        self.__pending = {}
+        self.__flush_task = None
+        self.__flush_lock = asyncio.Lock()
+        self.__last_flush_seconds = 0.0
+        self.__flush_count = 0
+
+    def load_reminders(self, shards=None) -> list:
+        return self.__storage.load_reminders(shards)
+
+    def get_change_sequence(self) -> int:
+        return self.__storage.get_change_sequence()
+
+    def load_changes(self, after: int, shards=None):
+        return self.__storage.load_changes(after, shards)
+
+    def write_changes(self, user_id: str, upserts: dict, deletes) -> None:
+        """
+        Queues changed reminders of a user to be written, later changes to the same reminder replace earlier ones
+        :param user_id: str
+        :param upserts: dict, Save objects by reminder key
+        :param deletes: iterable, Keys of removed reminders
+        :return: nothing
+        """
+        user_id = str(user_id)
+        if user_id not in self.__pending:
+            self.__pending[user_id] = ({}, set())
+        pending_upserts, pending_deletes = self.__pending.get(user_id)
+        for key in deletes:
+            pending_upserts.pop(key, None)
+            pending_deletes.add(key)
+        for key, save_object in upserts.items():
+            pending_deletes.discard(key)
+            pending_upserts[key] = save_object
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Not running inside the bot, write right away
+            self.flush_now()
+            return
+        if self.__flush_task is None:
+            self.__flush_task = loop.create_task(self.__flush_later())
+
+    async def __flush_later(self):
+        await asyncio.sleep(self.__delay)
+        self.__flush_task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Writes all pending changes in a thread executor
+        :return: nothing
+        """
+        # Lock keeps flushes in order
+        async with self.__flush_lock:
+            pending, self.__pending = self.__pending, {}
+            if len(pending) < 1:
+                return
+            await asyncio.get_running_loop().run_in_executor(None, self.__write_pending, pending)
+
+    def flush_now(self) -> None:
+        """
+        Writes all pending changes right away, used when the event loop is not running
+        :return: nothing
+        """
+        pending, self.__pending = self.__pending, {}
+        self.__write_pending(pending)
+
+    def __write_pending(self, pending: dict) -> None:
+        start = time.perf_counter()
+        for user_id, (upserts, deletes) in pending.items():
+            self.__storage.write_changes(user_id, upserts, deletes)
+        self.__last_flush_seconds = time.perf_counter() - start
+        self.__flush_count += 1
+
+    def get_queue_depth(self) -> int:
+        """
+        :return: int, Amount of reminder changes waiting to be written
+        """
+        return sum(len(upserts) + len(deletes) for upserts, deletes in self.__pending.values())
+
+    def get_last_flush_seconds(self) -> float:
+        return self.__last_flush_seconds
+
+    def get_flush_count(self) -> int:
+        return self.__flush_count
+
+    def close(self) -> None:
+        self.flush_now()
+        self.__storage.close()
+
+
+def get_reminder_storage():
+    """
+    Creates the reminder storage set with REMINDER_STORAGE, behind a write-behind queue if
+    REMINDER_WRITE_DELAY_SECONDS is set
+    :return: Reminder storage
+    """
+    if REMINDER_STORAGE == "json":
+        storage = JsonReminderStorage()
+    else:
+        storage = SqliteReminderStorage()
+        migrated = storage.migrate_from_json()
+        if migrated > 0:
+            print(f"Migrated {migrated} reminders from json files to {PATH_TO_REMINDER_DATABASE}")
+    if REMINDER_WRITE_DELAY_SECONDS > 0:
+        return WriteBehindReminderStorage(storage)
+    return storage
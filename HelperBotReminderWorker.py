@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+from datetime import datetime
+import discord
+from dotenv import load_dotenv
+
+from HelperBotConstants import *
+import HelperBotFunctions
+import HelperBotReminderOrganizer
+import HelperBotReminderShards
+
+
+class SimulatedReminderSender:
+    """
+    Writes reminders to a json lines file instead of sending them, for trying out workers without Discord
+    """
+
+    def __init__(self, path: str, worker_id: str):
+        self.__path = path
+        self.__worker_id = worker_id
+
+    async def send(self, reminder, messages_to_send: list) -> None:
+        record = {"worker_id": self.__worker_id, "user_id": str(reminder.get_user_id()),
+                  "reminder_id": reminder.get_reminder_id(), "message_id": str(reminder.get_message_id()),
+                  "reminder_timestamp": reminder.get_reminder_timestamp(),
+                  "sent_timestamp": datetime.now().timestamp(), "messages": len(messages_to_send)}
+        with open(self.__path, "a", encoding=ENCODING) as file:
+            file.write(json.dumps(record) + "\n")
+
+
+async def run_worker(worker_id: str, simulate_path: str = None, lease_seconds=REMINDER_SHARD_LEASE_SECONDS,
+                     heartbeat_seconds=REMINDER_SHARD_HEARTBEAT_SECONDS):
+    """
+    Sends reminders of the shards this worker owns until stopped
+    :param worker_id: str, Unique name of this worker
+    :param simulate_path: str, If given, reminders are written to this file instead of being sent
+    :param lease_seconds: float, How long the shards of a stopped worker are kept before others take them over
+    :param heartbeat_seconds: float, How often leases are renewed and reminders synced
+    :return: nothing
+    """
+    # Stopping with SIGTERM, e.g. docker stop, gives the shards away like Ctrl+C does
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    shard_manager = HelperBotReminderShards.ShardLeaseManager(worker_id, lease_seconds=lease_seconds,
+                                                              heartbeat_seconds=heartbeat_seconds)
+    client = None
+    if simulate_path is not None:
+        sender = SimulatedReminderSender(simulate_path, worker_id)
+    else:
+        load_dotenv()
+        # Sending only needs the REST API, no gateway connection
+        client = discord.Client(intents=discord.Intents.none())
+        await client.login(os.getenv('DISCORD_TOKEN'))
+        sender = HelperBotReminderOrganizer.DiscordReminderSender(client)
+    reminder_organizer = HelperBotReminderOrganizer.ReminderOrganizer(client, sender=sender,
+                                                                      shard_manager=shard_manager)
+    try:
+        await reminder_organizer.start()
+    finally:
+        # Nothing is sent after the shards are given away
+        reminder_organizer.release_shards()
+        await reminder_organizer.get_storage().flush()
+        reminder_organizer.close()
+        shard_manager.release_all()
+        shard_manager.close()
+        if client is not None:
+            await client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sends reminders of a share of users, see REMINDER_SHARDED")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--simulate", metavar="PATH", help="Write reminders to a json lines file instead of sending")
+    parser.add_argument("--lease-seconds", type=float, default=REMINDER_SHARD_LEASE_SECONDS)
+    parser.add_argument("--heartbeat-seconds", type=float, default=REMINDER_SHARD_HEARTBEAT_SECONDS)
+    args = parser.parse_args()
+    HelperBotFunctions.make_dirs()
+    try:
+        asyncio.run(run_worker(args.worker_id, args.simulate, args.lease_seconds, args.heartbeat_seconds))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
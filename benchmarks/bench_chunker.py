@@ -0,0 +1,87 @@
+"""
+Times splitting message pieces into messages with iterate_correct_length_messages, compared to the version that
+truncated long pieces. Run from the repository root: python benchmarks/bench_chunker.py
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from HelperBotConstants import MESSAGE_MAX_CHARACTERS, EMBED_MESSAGE_MAX_CHARACTERS, MAXIMUM_REMINDERS
+from HelperBotFunctions import craft_correct_length_messages
+
+
+def truncating_craft_messages(list_of_message_pieces, embed_message=False, make_code_format=False):
+    """
+    craft_correct_length_messages before long pieces were split, everything past the limit was dropped
+    """
+    current_message = ""
+    list_of_new_pieces = []
+    max_characters = MESSAGE_MAX_CHARACTERS
+    if embed_message:
+        max_characters = EMBED_MESSAGE_MAX_CHARACTERS
+    if make_code_format:
+        max_characters -= 6
+    for piece in list_of_message_pieces:
+        piece = str(piece)
+        if len(piece) > max_characters:
+            piece = piece[:max_characters]
+        if (len(piece) + len(current_message)) >= max_characters:
+            if current_message != "":
+                list_of_new_pieces.append(current_message)
+            current_message = ""
+        current_message += piece
+    list_of_new_pieces.append(current_message)
+    if make_code_format:
+        return [f"```{message}```" for message in list_of_new_pieces]
+    return list_of_new_pieces
+
+
+def make_reminder_list(amount: int) -> list:
+    """
+    :return: list, Texts like the ones of a reminder list
+    """
+    generator = random.Random(18)
+    words = ["call", "mom", "dentist", "pay", "rent", "meeting", "at", "10", "buy", "milk", "check", "the", "build"]
+    return [f"> **{index} : Mon 2024-01-01 10:00:00 -> Tue 2024-01-02 10:00:00\n"
+            f"> https://discord.com/channels/1/2/{100000 + index}**\n!reminder in 1 day\n"
+            f"{' '.join(generator.choice(words) for _ in range(generator.randint(3, 60)))}\n"
+            for index in range(amount)]
+
+
+def make_big_piece(size: int) -> str:
+    """
+    :return: str, One piece of words and lines of about size characters
+    """
+    generator = random.Random(19)
+    lines = []
+    length = 0
+    while length < size:
+        line = " ".join("x" * generator.randint(1, 12) for _ in range(generator.randint(1, 40)))
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines)
+
+
+def bench(name: str, function, pieces, **kwargs) -> None:
+    runs = 5
+    seconds = min(timeit.repeat(lambda: function(pieces, **kwargs), number=1, repeat=runs))
+    messages = function(pieces, **kwargs)
+    kept = sum(len(message) for message in messages) - (6 * len(messages) if kwargs.get("make_code_format") else 0)
+    print(f"  {name:<12} {seconds * 1000:9.2f} ms {len(messages):7} messages {kept:10} characters kept")
+
+
+def main():
+    cases = [(f"Full list of {MAXIMUM_REMINDERS} reminders", make_reminder_list(MAXIMUM_REMINDERS), {"embed_message": True}),
+             ("100k lines", [f"line {index}\n" for index in range(100000)], {}),
+             ("2 MB piece", [make_big_piece(2 * 1024 * 1024)], {}),
+             ("2 MB piece in code format", [make_big_piece(2 * 1024 * 1024)], {"make_code_format": True})]
+    for name, pieces, kwargs in cases:
+        print(f"{name}: {sum(len(piece) for piece in pieces)} characters")
+        bench("truncating", truncating_craft_messages, pieces, **kwargs)
+        bench("splitting", craft_correct_length_messages, pieces, **kwargs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Times cleaning links from a generated corpus of chat messages, 2% of them with youtube links, compared to the
+clean_youtube_links that searched every message with a regex and replaced links with str.replace.
+Run from the repository root: python benchmarks/bench_clean_links.py [amount of messages, 1000000 by default]
+"""
+import os
+import random
+import re
+import sys
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from HelperBotConstants import COMMAND_PREFIX, REMOVE_FROM_LINK
+from HelperBotFunctions import clean_links, clean_url
+
+
+def clean_youtube_links(message_content):
+    """
+    Link cleaning before links were cleaned in one pass
+    """
+    if message_content.startswith(f"{COMMAND_PREFIX}noclean") or message_content.startswith(f"{COMMAND_PREFIX}nc"):
+        return message_content
+    urls = re.findall(r'(https?://[\S]*youtu[\S]+)', message_content)
+    new_urls = []
+    for url in urls:
+        url = urlsplit(url)
+        query = url.query
+        split_char = "&"
+        for banned in REMOVE_FROM_LINK:
+            found_part = re.search(f"(?P<part>{split_char}?{banned}=[\\w\\d_]+[{split_char}\\s]?)", query)
+            if found_part is not None:
+                found_part = found_part.group("part")
+            else:
+                continue
+            if found_part.count(split_char) > 1:
+                found_part = found_part.replace(split_char, "", 1)
+            query = query.replace(found_part, "")
+        new_url = urlunsplit(url)
+        new_url = new_url.replace(url.query, query)
+        new_urls.append(new_url)
+    new_message_content = message_content
+    for url, new_url in zip(urls, new_urls):
+        new_message_content = new_message_content.replace(url, new_url)
+    return new_message_content
+
+
+def make_corpus(amount: int) -> list:
+    """
+    :return: list, Chat messages, 2% of them share one of 1000 youtube links
+    """
+    generator = random.Random(19)
+    words = ["hey", "what", "is", "up", "lol", "did", "you", "see", "that", "game", "tonight", "ok", "sure", "no"]
+    formats = ["https://www.youtube.com/watch?v={}&list=PL{}&index=3", "https://youtu.be/{}?si={}",
+               "https://www.youtube.com/watch?v={}&t={}s", "<https://www.youtube.com/watch?v={}&list=PL{}>"]
+    links = [generator.choice(formats).format(f"{generator.getrandbits(40):x}", generator.randint(1, 9999))
+             for _ in range(1000)]
+    corpus = []
+    for _ in range(amount):
+        message = " ".join(generator.choice(words) for _ in range(generator.randint(1, 15)))
+        if generator.random() < 0.02:
+            message = f"{message} {generator.choice(links)}"
+        corpus.append(message)
+    return corpus
+
+
+def bench(name: str, function, corpus: list) -> None:
+    clean_url.cache_clear()
+    start = time.perf_counter()
+    for message in corpus:
+        function(message)
+    seconds = time.perf_counter() - start
+    print(f"  {name:<20} {seconds:6.2f} s {seconds / len(corpus) * 1e9:8.0f} ns per message")
+
+
+def main():
+    amount = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    corpus = make_corpus(amount)
+    print(f"{amount} messages")
+    bench("clean_youtube_links", clean_youtube_links, corpus)
+    bench("clean_links", clean_links, corpus)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Measures with tracemalloc how many bytes each loaded Reminder takes, compared to Reminder before it had __slots__.
+The earlier Reminder is loaded from git, so this needs to be run from a clone of the repository:
+python benchmarks/bench_reminder_memory.py [amount of reminders, 1000000 by default]
+"""
+import gc
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+import types
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+from HelperBotReminderOrganizer import Reminder
+
+# Last commit before Reminder got __slots__
+BASELINE_COMMIT = "b84da1d^"
+
+
+def load_baseline_reminder():
+    """
+    :return: class, Reminder as it was at BASELINE_COMMIT
+    """
+    source = subprocess.run(["git", "show", f"{BASELINE_COMMIT}:HelperBotReminderOrganizer.py"], cwd=REPOSITORY,
+                            capture_output=True, check=True, text=True).stdout
+    module = types.ModuleType("baseline_reminder_organizer")
+    exec(compile(source, f"{BASELINE_COMMIT}:HelperBotReminderOrganizer.py", "exec"), module.__dict__)
+    return module.Reminder
+
+
+def make_save_lines(amount: int) -> list:
+    """
+    :return: list, Save objects like the ones in storage as json, every third reminder has an interval
+    """
+    commands = ["!reminder in 5 min", "!reminder in 1 day", "!reminder at tomorrow 10.00"]
+    save_lines = []
+    for index in range(amount):
+        command = commands[index % len(commands)]
+        save_object = {"reminder_timestamp": str(1.7e9 + index), "now_timestamp": str(1.7e9),
+                       "user_id": str(100000000000000000 + index % 5000),
+                       "message_id": str(200000000000000000 + index), "channel_id": "300000000000000000",
+                       "server_id": "400000000000000000", "raw_message": f"{command} do the thing",
+                       "message_commands": command, "message_text": " do the thing", "reminder_id": index % 200 + 1}
+        if index % 3 == 0:
+            save_object["interval_amount"] = 1
+            save_object["interval_measure"] = "days"
+        save_lines.append(json.dumps(save_object))
+    return save_lines
+
+
+def measure(reminder_class, save_lines: list) -> float:
+    """
+    Decodes each save object inside the measured part, so every reminder gets its own strings like when loading
+    from storage
+    :return: float, Bytes allocated per loaded reminder
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    reminders = []
+    for save_line in save_lines:
+        reminder = reminder_class()
+        reminder.load_from_json(json.loads(save_line))
+        reminders.append(reminder)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / len(save_lines)
+
+
+def main():
+    amount = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    save_lines = make_save_lines(amount)
+    baseline_reminder = load_baseline_reminder()
+    print(f"{amount} reminders")
+    print(f"  without __slots__ {measure(baseline_reminder, save_lines):6.0f} bytes per reminder ({BASELINE_COMMIT})")
+    print(f"  with __slots__    {measure(Reminder, save_lines):6.0f} bytes per reminder")
+
+
+if __name__ == "__main__":
+    main()
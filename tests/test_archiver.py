@@ -0,0 +1,22 @@
+import json
+import os
+from HelperBotConstants import ARCHIVE_ATTACHMENT_QUEUE_FILE, ARCHIVE_ATTACHMENT_RETRY_FILE
+from HelperBotArchiver import export_archive_json
+
+
+def write_jsonl(file_path, records):
+    with open(file_path, "w", encoding="utf-8") as file:
+        for record in records:
+            file.write(json.dumps(record) + "\n")
+
+
+def test_export_only_writes_channel_files(tmp_path):
+    write_jsonl(tmp_path / "123_general.jsonl", [{"message_id": "1", "content": "a"},
+                                                     {"message_id": "2", "content": "b"}])
+    attachment = {"attachment_id": 5, "attachment_url": "http://localhost/5", "size": 1}
+    write_jsonl(tmp_path / ARCHIVE_ATTACHMENT_QUEUE_FILE, [attachment])
+    write_jsonl(tmp_path / ARCHIVE_ATTACHMENT_RETRY_FILE, [attachment])
+    assert export_archive_json(str(tmp_path)) == 2
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith(".json")) == ["123_general.json"]
+    with open(tmp_path / "123_general.json", "r", encoding="utf-8") as file:
+        assert list(json.load(file)) == ["1", "2"]
@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+from aiohttp import web
+from HelperBotConstants import ARCHIVE_ATTACHMENT_QUEUE_FILE, ARCHIVE_ATTACHMENT_RETRY_FILE, \
+    ARCHIVE_DOWNLOAD_RETRY_RUNS
+from HelperBotAttachmentDownloader import AttachmentDownloader, iterate_attachment_queue, write_attachment_queue
+from HelperBotAttachmentStore import AttachmentStore, hash_file
+
+
+class AttachmentServer:
+    """
+    Local stand-in for the attachment CDN. The first request of every fifth file is answered with 503, the first
+    request of every third file is cut off halfway and files in missing are answered with 404
+    """
+
+    def __init__(self, files: dict):
+        self.files = files
+        self.missing = set()
+        self.hits = {}
+        self.ranges = 0
+        self.runner = None
+        self.port = None
+
+    async def handle(self, request):
+        file_id = int(request.match_info["file_id"])
+        if file_id in self.missing:
+            return web.Response(status=404)
+        self.hits[file_id] = self.hits.get(file_id, 0) + 1
+        first = self.hits.get(file_id) == 1
+        if first and file_id % 5 == 0:
+            return web.Response(status=503)
+        data = self.files.get(file_id)
+        start = 0
+        status = 200
+        if request.headers.get("Range") is not None:
+            start = int(request.headers.get("Range").split("=")[1].rstrip("-"))
+            status = 206
+            self.ranges += 1
+        response = web.StreamResponse(status=status)
+        response.content_length = len(data) - start
+        await response.prepare(request)
+        if first and file_id % 3 == 0:
+            await response.write(data[start:start + (len(data) - start) // 2])
+            request.transport.close()
+            return response
+        await response.write(data[start:])
+        await response.write_eof()
+        return response
+
+    def get_url(self, file_id) -> str:
+        return f"http://127.0.0.1:{self.port}/attachments/{file_id}"
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get("/attachments/{file_id}", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = self.runner.addresses[0][1]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.runner.cleanup()
+
+
+def make_files(amount: int) -> dict:
+    generator = random.Random(23)
+    files = {file_id: generator.randbytes(generator.randint(1000, 200000)) for file_id in range(amount)}
+    # Same content as another file, stored once
+    files[amount] = files.get(1)
+    return files
+
+
+def write_queue(folder, server: AttachmentServer) -> str:
+    os.makedirs(folder, exist_ok=True)
+    queue_path = str(folder) + os.sep + ARCHIVE_ATTACHMENT_QUEUE_FILE
+    attachments = [{"attachment_id": file_id, "attachment_url": server.get_url(file_id), "filename": f"{file_id}.bin",
+                    "size": len(data), "type": "bin",
+                    "manifest_path": str(folder) + os.sep + "attachments" + os.sep + "manifest.jsonl"}
+                   for file_id, data in server.files.items()]
+    write_attachment_queue(queue_path, attachments)
+    return queue_path
+
+
+def make_store(tmp_path) -> AttachmentStore:
+    return AttachmentStore(str(tmp_path / "attachments.db"), str(tmp_path / "blobs"))
+
+
+def test_flaky_downloads_are_stored_and_failures_queued_for_retry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    async def run():
+        async with AttachmentServer(make_files(30)) as server:
+            server.missing.add(13)
+            queue_path = write_queue(tmp_path / "archive_1", server)
+            store = make_store(tmp_path)
+            downloader = AttachmentDownloader(store, concurrency=4, retries=3, backoff_seconds=0.01)
+            await downloader.download_queue(queue_path)
+            assert downloader.get_downloaded_amount() == 30
+            assert downloader.get_duplicate_amount() == 1
+            assert downloader.get_failed_amount() == 1
+            assert downloader.get_retry_amount() == 1
+            # Cut off downloads were continued instead of started over
+            assert server.ranges > 0
+            assert not os.path.exists(queue_path)
+            assert os.path.isfile(queue_path + ".done")
+            for file_id, data in server.files.items():
+                if file_id == 13:
+                    assert not store.has_attachment(file_id)
+                    continue
+                assert store.has_attachment(file_id)
+            blobs = [entry for entry in os.scandir(tmp_path / "blobs") if entry.name != "tmp"]
+            stored = {hash_file(blob.path) for folder in blobs for blob in os.scandir(folder.path)}
+            expected = {hashlib.sha256(data).hexdigest() for file_id, data in server.files.items() if file_id != 13}
+            assert stored == expected
+            retry_path = str(tmp_path / "archive_1" / ARCHIVE_ATTACHMENT_RETRY_FILE)
+            retry = list(iterate_attachment_queue(retry_path))
+            assert [attachment.get("attachment_id") for attachment in retry] == [13]
+            assert retry[0].get("retry_runs") == 1
+
+            # The next run downloads the attachment once it is available again
+            server.missing.clear()
+            downloader = AttachmentDownloader(store, concurrency=4, retries=3, backoff_seconds=0.01)
+            await downloader.download_queue(retry_path)
+            assert downloader.get_downloaded_amount() == 1
+            assert downloader.get_failed_amount() == 0
+            assert store.has_attachment(13)
+            assert not os.path.exists(retry_path)
+            manifest_path = tmp_path / "archive_1" / "attachments" / "manifest.jsonl"
+            with open(manifest_path, "r", encoding="utf-8") as file:
+                manifest = [json.loads(line) for line in file]
+            assert sorted(int(entry.get("attachment_id")) for entry in manifest) == sorted(server.files)
+            store.close()
+
+    asyncio.run(run())
+
+
+def test_failed_attachment_is_given_up_after_retry_runs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    async def run():
+        async with AttachmentServer({7: b"data"}) as server:
+            server.missing.add(7)
+            folder = tmp_path / "archive_1"
+            os.makedirs(folder)
+            retry_path = str(folder) + os.sep + ARCHIVE_ATTACHMENT_RETRY_FILE
+            write_attachment_queue(retry_path, [{"attachment_id": 7, "attachment_url": server.get_url(7),
+                                                 "filename": "7.bin", "size": 4,
+                                                 "retry_runs": ARCHIVE_DOWNLOAD_RETRY_RUNS - 1}])
+            store = make_store(tmp_path)
+            downloader = AttachmentDownloader(store, retries=0)
+            await downloader.download_queue(retry_path)
+            assert list(iterate_attachment_queue(retry_path))[0].get("retry_runs") == ARCHIVE_DOWNLOAD_RETRY_RUNS
+            await downloader.download_queue(retry_path)
+            assert not os.path.exists(retry_path)
+            assert downloader.get_failed_amount() == 2
+            store.close()
+
+    asyncio.run(run())
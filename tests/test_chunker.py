@@ -0,0 +1,53 @@
+import random
+import pytest
+from HelperBotConstants import MESSAGE_MAX_CHARACTERS, EMBED_MESSAGE_MAX_CHARACTERS
+from HelperBotFunctions import craft_correct_length_messages
+
+
+def check_messages(pieces, embed_message=False, make_code_format=False):
+    messages = craft_correct_length_messages(pieces, embed_message, make_code_format)
+    max_characters = EMBED_MESSAGE_MAX_CHARACTERS if embed_message else MESSAGE_MAX_CHARACTERS
+    for message in messages:
+        assert 0 < len(message) <= max_characters
+    if make_code_format:
+        assert all(message.startswith("```") and message.endswith("```") for message in messages)
+        messages = [message[3:-3] for message in messages]
+    # Nothing is dropped or repeated
+    assert "".join(messages) == "".join(str(piece) for piece in pieces)
+    return messages
+
+
+def make_text(generator, size):
+    return "".join(generator.choices("abc  \n", k=size))
+
+
+@pytest.mark.parametrize("embed_message", [False, True])
+@pytest.mark.parametrize("make_code_format", [False, True])
+def test_random_pieces_keep_limit_and_text(embed_message, make_code_format):
+    generator = random.Random(18)
+    for _ in range(100):
+        pieces = [make_text(generator, generator.choice([0, 5, 300, 1999, 2000, 2001, 5000]))
+                  for _ in range(generator.randint(1, 20))]
+        check_messages(pieces, embed_message, make_code_format)
+
+
+def test_long_piece_is_split_on_line_breaks():
+    line = "x" * 99 + "\n"
+    messages = check_messages([line * 100])
+    assert all(message.endswith("\n") for message in messages)
+
+
+def test_piece_without_breaks_is_split_at_the_limit():
+    messages = check_messages(["x" * (MESSAGE_MAX_CHARACTERS * 3 + 1)])
+    assert [len(message) for message in messages] == [MESSAGE_MAX_CHARACTERS] * 3 + [1]
+
+
+def test_multi_megabyte_piece():
+    generator = random.Random(19)
+    words = ["word", "longer", "x" * 30, "\n"]
+    piece = " ".join(generator.choice(words) for _ in range(500000))
+    check_messages([piece])
+
+
+def test_pieces_that_fit_are_joined():
+    assert craft_correct_length_messages(["a\n", "b\n"]) == ["a\nb\n"]
@@ -0,0 +1,40 @@
+import pytest
+from HelperBotFunctions import clean_links
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("https://www.youtube.com/watch?v=abc&list=PL1", "https://www.youtube.com/watch?v=abc"),
+    ("<https://www.youtube.com/watch?v=abc&list=PL1>", "<https://www.youtube.com/watch?v=abc>"),
+    ("look https://www.youtube.com/watch?v=abc&list=PL1, nice", "look https://www.youtube.com/watch?v=abc, nice"),
+    ("(https://youtu.be/abc?si=x)", "(https://www.youtube.com/watch?v=abc)"),
+    ("[https://www.youtube.com/watch?v=abc&index=2]", "[https://www.youtube.com/watch?v=abc]"),
+    ('"https://www.youtube.com/watch?v=abc&list=PL1"', '"https://www.youtube.com/watch?v=abc"'),
+    ("https://www.youtube.com/watch?v=abc&list=PL1.", "https://www.youtube.com/watch?v=abc."),
+    ("what about https://www.youtube.com/watch?v=abc&list=PL1?!", "what about https://www.youtube.com/watch?v=abc?!"),
+    ("||https://youtu.be/abc?si=x|| spoiler", "||https://www.youtube.com/watch?v=abc|| spoiler"),
+    ("**https://www.youtube.com/watch?v=a&list=b** bold", "**https://www.youtube.com/watch?v=a** bold"),
+    ("__*https://www.youtube.com/watch?v=a&index=2*__", "__*https://www.youtube.com/watch?v=a*__"),
+    ("~~https://www.youtube.com/watch?v=a&list=b~~.", "~~https://www.youtube.com/watch?v=a~~."),
+])
+def test_punctuation_and_markdown_around_link_are_kept(message, expected):
+    assert clean_links(message) == expected
+
+
+def test_link_without_removed_parameters_is_unchanged():
+    message = "(https://www.youtube.com/watch?v=abc&t=10)."
+    assert clean_links(message) == message
+
+
+def test_noclean_is_left_alone():
+    message = "!noclean https://www.youtube.com/watch?v=abc&list=PL1"
+    assert clean_links(message) == message
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("(see https://example.com/a?utm_source=x&id=1).", "(see https://example.com/a?id=1)."),
+    ("<https://open.spotify.com/track/1?si=abc>!", "<https://open.spotify.com/track/1>!"),
+    ("https://m.youtube.com/shorts/xyz?feature=share,", "https://m.youtube.com/watch?v=xyz,"),
+    ("[https://sub.example.org/page?fbclid=1&utm_medium=2];", "[https://sub.example.org/page];"),
+])
+def test_host_rules_keep_punctuation_around_link(message, expected):
+    assert clean_links(message) == expected
@@ -0,0 +1,59 @@
+import asyncio
+import datetime
+import discord
+from HelperBotConstants import BULK_DELETE_MAX_AGE_SECONDS
+from HelperBotMessageDeleter import BulkDeleter
+
+
+class FakeChannel(discord.TextChannel):
+    def __init__(self):
+        self.id = 1
+        self.calls = []
+
+    async def delete_messages(self, messages):
+        oldest = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=14)
+        assert all(message.created_at > oldest for message in messages)
+        self.calls.append(("bulk", [message.id for message in messages]))
+
+
+class FakeMessage:
+    def __init__(self, channel, message_id, age_seconds):
+        self.channel = channel
+        self.id = message_id
+        self.created_at = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=age_seconds)
+
+    async def delete(self):
+        self.channel.calls.append(("single", self.id))
+
+
+def test_collected_messages_are_deleted_before_old_ones():
+    channel = FakeChannel()
+
+    async def run():
+        deleter = BulkDeleter(channel)
+        # History is read newest first
+        for message_id, age in [(5, 10), (4, 20), (3, BULK_DELETE_MAX_AGE_SECONDS + 10),
+                                (2, BULK_DELETE_MAX_AGE_SECONDS + 20)]:
+            await deleter.add(FakeMessage(channel, message_id, age))
+        await deleter.flush()
+        assert channel.calls == [("bulk", [5, 4]), ("single", 3), ("single", 2)]
+        assert deleter.get_deleted_in_bulk() == 2
+        assert deleter.get_deleted_one_by_one() == 2
+
+    asyncio.run(run())
+
+
+def test_messages_that_got_too_old_while_collected_are_deleted_one_by_one():
+    channel = FakeChannel()
+
+    async def run():
+        deleter = BulkDeleter(channel)
+        messages = [FakeMessage(channel, message_id, 10) for message_id in (3, 2, 1)]
+        for message in messages:
+            await deleter.add(message)
+        # A long job took so long that the last collected message is now too old for bulk deletion
+        messages[2].created_at -= datetime.timedelta(seconds=BULK_DELETE_MAX_AGE_SECONDS)
+        await deleter.flush()
+        assert channel.calls == [("single", 1), ("bulk", [3, 2])]
+
+    asyncio.run(run())
@@ -0,0 +1,49 @@
+import random
+import discord
+from HelperBotConstants import EMBEDS_PER_MESSAGE, EMBED_TOTAL_MAX_CHARACTERS
+from HelperBotFunctions import pack_embeds
+
+
+def make_embed(index, length):
+    title = f"Embed {index}"
+    return discord.Embed(title=title, description="x" * max(length - len(title), 1))
+
+
+def check_groups(embeds, groups):
+    for group in groups:
+        assert 0 < len(group) <= EMBEDS_PER_MESSAGE
+        assert sum(len(embed) for embed in group) <= EMBED_TOTAL_MAX_CHARACTERS
+    # Every embed is sent once and in the original order
+    assert [embed for group in groups for embed in group] == embeds
+
+
+def test_small_embeds_are_split_by_count():
+    embeds = [make_embed(index, 20) for index in range(25)]
+    groups = pack_embeds(embeds)
+    check_groups(embeds, groups)
+    assert [len(group) for group in groups] == [10, 10, 5]
+
+
+def test_big_embeds_are_split_by_characters():
+    embeds = [make_embed(index, 2000) for index in range(7)]
+    groups = pack_embeds(embeds)
+    check_groups(embeds, groups)
+    assert [len(group) for group in groups] == [3, 3, 1]
+
+
+def test_embeds_exactly_at_the_limit_fit_together():
+    embeds = [make_embed(index, EMBED_TOTAL_MAX_CHARACTERS // 2) for index in range(4)]
+    groups = pack_embeds(embeds)
+    check_groups(embeds, groups)
+    assert [len(group) for group in groups] == [2, 2]
+
+
+def test_random_embeds_keep_limits_and_order():
+    generator = random.Random(17)
+    for _ in range(200):
+        embeds = [make_embed(index, generator.randint(1, 4096)) for index in range(generator.randint(0, 40))]
+        check_groups(embeds, pack_embeds(embeds))
+
+
+def test_no_embeds_give_no_messages():
+    assert pack_embeds([]) == []
@@ -0,0 +1,14 @@
+from HelperBotConstants import MAXIMUM_FAILED_COUNT, REMINDER_RETRY_MAX_SECONDS, REMINDER_RETRY_SECONDS
+from HelperBotReminderOrganizer import get_retry_delay
+
+
+def test_retry_delay_doubles_up_to_the_maximum():
+    assert [get_retry_delay(failed_count) for failed_count in range(4)] == \
+           [REMINDER_RETRY_SECONDS * factor for factor in (1, 2, 4, 8)]
+    assert get_retry_delay(MAXIMUM_FAILED_COUNT) == REMINDER_RETRY_MAX_SECONDS
+
+
+def test_retries_outlast_a_long_outage():
+    # Reminders are retried MAXIMUM_FAILED_COUNT + 1 times before they are removed
+    total = sum(get_retry_delay(failed_count) for failed_count in range(MAXIMUM_FAILED_COUNT + 1))
+    assert total > 6 * 60 * 60
@@ -0,0 +1,21 @@
+from HelperBotReminderShards import ShardLeaseManager
+from HelperBotReminderStorage import SqliteReminderStorage
+
+
+def test_heartbeat_does_not_change_reminders(tmp_path):
+    storage = SqliteReminderStorage(str(tmp_path / "reminders.db"))
+    manager = ShardLeaseManager("worker", path=str(tmp_path / "reminder_shards.db"), shard_count=4)
+    change_sequence = storage.get_change_sequence()
+    assert manager.heartbeat() == {0, 1, 2, 3}
+    manager.heartbeat()
+    assert storage.load_changes(change_sequence) == (change_sequence, [])
+
+
+def test_shards_are_shared_between_workers(tmp_path):
+    path = str(tmp_path / "reminder_shards.db")
+    first = ShardLeaseManager("first", path=path, shard_count=4)
+    second = ShardLeaseManager("second", path=path, shard_count=4)
+    first.heartbeat()
+    second.heartbeat()
+    # The first worker gives away shards over its share, they are free once the grace period is over
+    assert len(first.heartbeat()) == 2
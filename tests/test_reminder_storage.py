@@ -0,0 +1,39 @@
+import HelperBotReminderStorage
+from HelperBotConstants import REMINDER_SHARD_COUNT
+from HelperBotReminderStorage import SqliteReminderStorage
+
+
+def make_save_object(user_id, message_id, timestamp=1000.0):
+    return {"reminder_timestamp": str(timestamp), "now_timestamp": "0", "user_id": str(user_id),
+            "message_id": str(message_id), "channel_id": "1", "server_id": "1", "raw_message": "x",
+            "message_commands": "!r", "message_text": "x"}
+
+
+def test_changes_of_other_processes_are_loaded_once_as_they_are_now(tmp_path):
+    path = str(tmp_path / "reminders.db")
+    writer = SqliteReminderStorage(path)
+    reader = SqliteReminderStorage(path)
+    start = reader.get_change_sequence()
+    writer.write_changes("1", {"10": make_save_object(1, 10), "11": make_save_object(1, 11)}, [])
+    writer.write_changes("1", {"10": make_save_object(1, 10, 2000.0)}, ["11"])
+    writer.write_changes("2", {"20": make_save_object(2, 20)}, [])
+    latest, changes = reader.load_changes(start)
+    assert latest == writer.get_change_sequence()
+    # In the order of their latest change
+    assert changes == [("11", "1", None), ("10", "1", make_save_object(1, 10, 2000.0)),
+                       ("20", "2", make_save_object(2, 20))]
+    assert reader.load_changes(latest) == (latest, [])
+    # Only changes of the given shards
+    _, changes = reader.load_changes(start, {2 % REMINDER_SHARD_COUNT})
+    assert [key for key, _, _ in changes] == ["20"]
+
+
+def test_falling_behind_the_change_log_needs_a_full_load(tmp_path, monkeypatch):
+    monkeypatch.setattr(HelperBotReminderStorage, "REMINDER_CHANGE_LOG_SIZE", 3)
+    storage = SqliteReminderStorage(str(tmp_path / "reminders.db"))
+    start = storage.get_change_sequence()
+    for message_id in range(5):
+        storage.write_changes("1", {str(message_id): make_save_object(1, message_id)}, [])
+    assert storage.load_changes(start) is None
+    latest, changes = storage.load_changes(storage.get_change_sequence() - 3)
+    assert [key for key, _, _ in changes] == ["2", "3", "4"]
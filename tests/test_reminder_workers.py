@@ -0,0 +1,139 @@
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+import pytest
+from HelperBotConstants import PATH_TO_REMINDER_DATABASE, PATH_TO_REMINDER_SHARD_DATABASE, REMINDER_SHARD_COUNT, \
+    REMINDER_WRITE_DELAY_SECONDS
+from HelperBotReminderShards import get_shard
+from HelperBotReminderStorage import SqliteReminderStorage
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKER_IDS = ["worker-1", "worker-2", "worker-3"]
+REMINDER_AMOUNT = 300
+HEARTBEAT_SECONDS = 0.3
+LEASE_SECONDS = 1.5
+
+
+def write_reminders(tmp_path, start: float) -> None:
+    """
+    Reminders of REMINDER_AMOUNT users, due over 6 seconds from start
+    """
+    storage = SqliteReminderStorage(str(tmp_path / PATH_TO_REMINDER_DATABASE))
+    for index in range(REMINDER_AMOUNT):
+        user_id = str(1000 + index)
+        message_id = str(5000 + index)
+        storage.write_changes(user_id, {message_id: {
+            "reminder_timestamp": str(start + 6 * index / REMINDER_AMOUNT), "now_timestamp": str(start),
+            "user_id": user_id, "message_id": message_id, "channel_id": "1", "server_id": "1",
+            "raw_message": "!reminder test", "message_commands": "!reminder", "message_text": "test",
+            "reminder_id": 1}}, [])
+    storage.close()
+
+
+def start_worker(tmp_path, worker_id: str):
+    return subprocess.Popen([sys.executable, os.path.join(REPOSITORY, "HelperBotReminderWorker.py"),
+                             "--worker-id", worker_id, "--simulate", "sent.jsonl",
+                             "--heartbeat-seconds", str(HEARTBEAT_SECONDS), "--lease-seconds", str(LEASE_SECONDS)],
+                            cwd=tmp_path, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def read_sent(tmp_path) -> list:
+    if not os.path.isfile(tmp_path / "sent.jsonl"):
+        return []
+    with open(tmp_path / "sent.jsonl", "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.endswith("\n")]
+
+
+def get_lease_owners(tmp_path) -> dict:
+    connection = sqlite3.connect(str(tmp_path / PATH_TO_REMINDER_SHARD_DATABASE), timeout=30)
+    owners = {}
+    for shard, owner in connection.execute("SELECT shard, owner FROM shard_leases WHERE expires > ?", (time.time(),)):
+        owners[owner] = owners.get(owner, 0) + 1
+    connection.close()
+    return owners
+
+
+def is_shared(tmp_path, worker_amount: int) -> bool:
+    """
+    :return: bool, True if worker_amount workers own all shards
+    """
+    try:
+        owners = get_lease_owners(tmp_path)
+    except sqlite3.OperationalError:
+        # The workers haven't created the table yet
+        return False
+    return len(owners) == worker_amount and sum(owners.values()) == REMINDER_SHARD_COUNT
+
+
+def run_workers(tmp_path, stop_signal) -> tuple:
+    """
+    Runs three workers and stops worker-1 with stop_signal while reminders are being sent
+    :return: tuple, Sent records and the time worker-1 was stopped
+    """
+    os.makedirs(tmp_path / "Discord" / "data" / "reminders")
+    workers = {worker_id: start_worker(tmp_path, worker_id) for worker_id in WORKER_IDS}
+    try:
+        # The reminders are synced to the workers once the shards are shared between them
+        deadline = time.time() + 30
+        while time.time() < deadline and not is_shared(tmp_path, len(WORKER_IDS)):
+            time.sleep(0.2)
+        assert is_shared(tmp_path, len(WORKER_IDS))
+        start = time.time() + 1
+        write_reminders(tmp_path, start)
+        time.sleep(start + 2 - time.time())
+        workers.get("worker-1").send_signal(stop_signal)
+        workers.get("worker-1").wait(timeout=10)
+        stopped = time.time()
+        deadline = time.time() + 20
+        while len({record.get("message_id") for record in read_sent(tmp_path)}) < REMINDER_AMOUNT and \
+                time.time() < deadline:
+            time.sleep(0.2)
+        # Leases were renewed by the workers that are left
+        time.sleep(HEARTBEAT_SECONDS * 3)
+        owners = get_lease_owners(tmp_path)
+    finally:
+        for worker in workers.values():
+            if worker.poll() is None:
+                worker.terminate()
+            worker.wait(timeout=10)
+    for worker_id in WORKER_IDS[1:]:
+        assert workers.get(worker_id).returncode == 0, workers.get(worker_id).stderr.read().decode()
+    assert owners == {"worker-2": REMINDER_SHARD_COUNT // 2, "worker-3": REMINDER_SHARD_COUNT // 2}
+    return read_sent(tmp_path), stopped
+
+
+def check_all_sent(sent: list, stopped: float) -> None:
+    assert {record.get("message_id") for record in sent} == {str(5000 + index) for index in range(REMINDER_AMOUNT)}
+    assert {record.get("worker_id") for record in sent} == set(WORKER_IDS)
+    # Shards of the stopped worker were taken over by the others
+    stopped_shards = {get_shard(record.get("user_id")) for record in sent if record.get("worker_id") == "worker-1"}
+    assert any(get_shard(record.get("user_id")) in stopped_shards and record.get("sent_timestamp") > stopped
+               for record in sent)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Needs POSIX signals")
+def test_stopped_worker_gives_its_shards_away(tmp_path):
+    sent, stopped = run_workers(tmp_path, signal.SIGTERM)
+    check_all_sent(sent, stopped)
+    message_ids = [record.get("message_id") for record in sent]
+    assert len(message_ids) == len(set(message_ids))
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Needs POSIX signals")
+def test_killed_worker_shards_are_taken_over(tmp_path):
+    sent, stopped = run_workers(tmp_path, signal.SIGKILL)
+    check_all_sent(sent, stopped)
+    # A killed worker can't write that it sent the reminders of its last REMINDER_WRITE_DELAY_SECONDS, only those can
+    # be sent again
+    first_sent = {}
+    for record in sent:
+        message_id = record.get("message_id")
+        if message_id in first_sent:
+            assert first_sent.get(message_id).get("worker_id") == "worker-1"
+            assert first_sent.get(message_id).get("sent_timestamp") > stopped - REMINDER_WRITE_DELAY_SECONDS - 1
+            continue
+        first_sent[message_id] = record